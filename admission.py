@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+# a job whose packages took more than this to test counts as two slots
+HEAVY_JOB_SECS = int(os.getenv('TATTOO_HEAVY_JOB_SECS', str(2 * 3600)))
+
+
+def read_psi(resource: str) -> float | None:
+    """Return the ``some avg10`` pressure of cpu, memory or io, in percents."""
+    try:
+        with open(f'/proc/pressure/{resource}', encoding='utf8') as file:
+            for line in file:
+                if line.startswith('some '):
+                    return float(dict(field.split('=') for field in line.split()[1:])['avg10'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def mem_available_ratio() -> float | None:
+    try:
+        with open('/proc/meminfo', encoding='utf8') as file:
+            meminfo = {key: int(value.split()[0]) for key, value in (line.split(':', maxsplit=1) for line in file)}
+        return meminfo['MemAvailable'] / meminfo['MemTotal']
+    except (OSError, ValueError, KeyError, ZeroDivisionError):
+        return None
+
+
+def host_pressure(max_load: float = float(os.getenv('TATTOO_MAX_LOAD', '1.0'))) -> str:
+    """Return why the host is overloaded, or an empty string if it isn't.
+
+    ``max_load`` is the highest allowed 1 minute load average per CPU.
+    Thresholds for available memory and PSI come from ``TATTOO_MIN_MEM_AVAILABLE``
+    (ratio, default 0.15) and ``TATTOO_MAX_PSI`` (percent, default 30).
+    """
+    if (load := os.getloadavg()[0] / (os.cpu_count() or 1)) > max_load:
+        return f'load {100 * load:.0f}%'
+    if (mem := mem_available_ratio()) is not None and mem < float(os.getenv('TATTOO_MIN_MEM_AVAILABLE', '0.15')):
+        return f'memory available {100 * mem:.0f}%'
+    max_psi = float(os.getenv('TATTOO_MAX_PSI', '30'))
+    for resource in ('memory', 'io', 'cpu'):
+        if (psi := read_psi(resource)) is not None and psi > max_psi:
+            return f'{resource} pressure {psi:.0f}%'
+    return ''
+
+
+def job_cost(duration: float | None) -> int:
+    """Return the amount of slots a job takes, by the expected duration of its packages."""
+    return 2 if duration is not None and duration > HEAVY_JOB_SECS else 1
+
+
+class AdmissionController:
+    """Decide how many job slots, between ``min_jobs`` and ``max_jobs``, may run now.
+
+    Every interval the allowed slots go down by one while the host is
+    overloaded, and back up by one while it has room.
+    """
+
+    def __init__(self, min_jobs: int, max_jobs: int, interval: float = 30):
+        self.min_jobs = min_jobs
+        self.max_jobs = max_jobs
+        self.interval = interval
+        self.allowed = max_jobs
+        self.reason = ''
+        self.running = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, cost: int = 1, held: int = 0):
+        """Wait for ``cost`` more slots, for a job already holding ``held`` slots.
+
+        The held slots are given back while waiting, so jobs waiting for more
+        slots can't hold all of them and wait for each other forever.
+        """
+        async with self.condition:
+            self.running -= held
+            self.condition.notify_all()
+            granted = 0
+            try:
+                # a single job always runs, even if its cost is more than allowed
+                await self.condition.wait_for(lambda: self.running == 0 or self.running + held + cost <= self.allowed)
+                granted = cost
+            finally:
+                self.running += held + granted
+
+    async def release(self, cost: int = 1):
+        async with self.condition:
+            self.running -= cost
+            self.condition.notify_all()
+
+    async def update(self):
+        self.reason = host_pressure()
+        if self.reason:
+            allowed = max(self.min_jobs, self.allowed - 1)
+        else:
+            allowed = min(self.max_jobs, self.allowed + 1)
+        if allowed != self.allowed:
+            logging.info('admission: %d slots allowed (%s)', allowed, self.reason or 'host has room')
+            self.allowed = allowed
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def run(self):
+        with contextlib.suppress(asyncio.CancelledError):
+            while True:
+                await self.update()
+                await asyncio.sleep(self.interval)
@@ -0,0 +1 @@
+"""Stand-in for nattka, used by the benchmark harness instead of real bugzilla."""
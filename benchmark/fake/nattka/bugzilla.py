@@ -0,0 +1,85 @@
+"""Stand-in for ``nattka.bugzilla``, serving generated bugs from memory.
+
+Configured by environment variables:
+
+``FAKE_BUGZILLA_BUGS``
+    amount of open bugs (default 1000), numbered from ``FIRST_BUG``
+``FAKE_BUGZILLA_ARCHES``
+    comma delimited arches CCed on every bug (default ``amd64``)
+``FAKE_BUGZILLA_KEYWORDREQ_RATIO``
+    ratio of keyword requests among the bugs (default 0)
+``FAKE_BUGZILLA_LATENCY``
+    seconds every ``find_bugs`` call takes (default 0)
+"""
+
+import enum
+import os
+import random
+import time
+from typing import Iterable, NamedTuple
+
+FIRST_BUG = 100000
+
+
+class BugCategory(enum.Enum):
+    KEYWORDREQ = enum.auto()
+    STABLEREQ = enum.auto()
+
+
+class BugRuntimeTestingState(enum.Enum):
+    MANUAL = 'Manual'
+
+
+class BugInfo(NamedTuple):
+    category: BugCategory | None
+    atoms: str
+    cc: list[str]
+    depends: list[int]
+    blocks: list[int]
+    sanity_check: bool | None
+    security: bool
+    keywords: list[str]
+    runtime_testing_required: BugRuntimeTestingState | None = None
+
+
+def generate_bugs() -> dict[int, BugInfo]:
+    count = int(os.getenv('FAKE_BUGZILLA_BUGS', '1000'))
+    arches = os.getenv('FAKE_BUGZILLA_ARCHES', 'amd64').split(',')
+    keywordreq_ratio = float(os.getenv('FAKE_BUGZILLA_KEYWORDREQ_RATIO', '0'))
+    rand = random.Random(count)
+    return {
+        bug_no: BugInfo(
+            category=BugCategory.KEYWORDREQ if rand.random() < keywordreq_ratio else BugCategory.STABLEREQ,
+            atoms=f'=dev-bench/pkg{bug_no}-1.0',
+            cc=[f'{arch}@gentoo.org' for arch in arches],
+            depends=[],
+            blocks=[],
+            sanity_check=True,
+            security=False,
+            keywords=['CC-ARCHES'],
+        )
+        for bug_no in range(FIRST_BUG, FIRST_BUG + count)
+    }
+
+
+class NattkaBugzilla:
+    bugs = generate_bugs()
+
+    def __init__(self, api_key: str | None = None, *args, **kwargs):
+        self.api_key = api_key
+        self.latency = float(os.getenv('FAKE_BUGZILLA_LATENCY', '0'))
+
+    def find_bugs(self, bugs: Iterable[int] = (), unresolved: bool = False,
+                  sanity_check: Iterable[bool] = (), cc: Iterable[str] = (), **kwargs) -> dict[int, BugInfo]:
+        time.sleep(self.latency)
+        bugs, sanity_check, cc = frozenset(bugs), frozenset(sanity_check), frozenset(cc)
+        return {
+            bug_no: bug
+            for bug_no, bug in NattkaBugzilla.bugs.items()
+            if (not bugs or bug_no in bugs)
+            and (not sanity_check or bug.sanity_check in sanity_check)
+            and (not cc or cc.intersection(bug.cc))
+        }
+
+    def resolve_bug(self, bugno: int, uncc: Iterable[str], comment: str, resolve: bool = False):
+        time.sleep(self.latency)
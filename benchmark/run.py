@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""Hermetic load test of manager and testers, against stand-in bugzilla and pkgdev.
+
+Runs the real ``manager.py`` and several ``tester.py`` processes inside a
+temporary directory, submits all the generated bugs and waits until every
+result is in the DB. Afterwards runs micro benchmarks of the hot paths
+(messages, BugsQueue, DB and collect_bugs) with thousands of bugs.
+"""
+
+import asyncio
+import contextlib
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Iterator
+
+benchmark_dir = Path(__file__).resolve().parent
+source_dir = benchmark_dir.parent
+sys.path[:0] = [str(benchmark_dir / 'fake'), str(source_dir)]
+
+# pylint: disable=wrong-import-position
+import bugs_fetcher
+import messages
+from bugs_queue import BugsQueue, BugsQueueItem
+from db import DB
+from nattka.bugzilla import FIRST_BUG
+
+
+def histogram_quantiles(text: str, name: str, *quantiles: float) -> tuple[float, ...]:
+    """Approximate quantiles of a histogram from Prometheus text, summed over all labels."""
+    buckets: dict[float, float] = {}
+    for line in text.splitlines():
+        if line.startswith(f'{name}_bucket{{'):
+            labels, value = line.rsplit(' ', maxsplit=1)
+            bound = labels.split('le="', maxsplit=1)[1].split('"', maxsplit=1)[0]
+            buckets[float(bound)] = buckets.get(float(bound), 0) + float(value)
+    if not buckets or not (total := buckets[max(buckets)]):
+        return tuple(float('nan') for _ in quantiles)
+    return tuple(
+        next(bound for bound, count in sorted(buckets.items()) if count >= quantile * total)
+        for quantile in quantiles
+    )
+
+
+def metric_values(text: str, name: str, label: str = '') -> Iterator[float]:
+    """Values of a metric for all labels, or only the samples with the given ``label="value"``."""
+    return (
+        float(line.rsplit(' ', maxsplit=1)[1])
+        for line in text.splitlines()
+        if line.startswith((f'{name} ', f'{name}{{')) and label in line
+    )
+
+
+def metric_sum(text: str, name: str) -> float:
+    return sum(metric_values(text, name))
+
+
+def peak_memory_kb(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf8') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def manager_request(socket_file: Path, obj):
+    reader, writer = await asyncio.open_unix_connection(path=socket_file)
+    try:
+        writer.write(messages.dump(messages.Worker(name='', arch='')))
+        writer.write(messages.dump(obj))
+        await writer.drain()
+        if isinstance(obj, messages.GetMetrics):
+            return messages.load(await reader.readuntil(b'\n'))
+        return None
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def load_test(options, work_dir: Path) -> dict[str, str]:
+    env = os.environ | {
+        'PYTHONPATH': os.pathsep.join((str(benchmark_dir / 'fake'), str(source_dir))),
+        'PATH': os.pathsep.join((str(benchmark_dir / 'bin'), os.environ.get('PATH', ''))),
+        'HOME': str(work_dir / 'home'),
+        'STATE_DIRECTORY': str(work_dir),
+        'TATTOO_TESTING_DIR': str(work_dir / 'run'),
+        'BUGZILLA_RATE': '100000',
+        'BUGZILLA_BURST': '100000',
+        'TATTOO_METRICS_PUSH_SECS': '1',
+        'FAKE_BUGZILLA_BUGS': str(options.bugs),
+        'FAKE_BUGZILLA_ARCHES': options.arch,
+        'FAKE_BUGZILLA_LATENCY': str(options.bugzilla_latency),
+        'FAKE_PKGDEV_BUILD_SECONDS': str(options.build_seconds),
+        'FAKE_PKGDEV_FAILURE_RATE': str(options.failure_rate),
+        'FAKE_PKGDEV_TATT_FAILURE_RATE': str(options.tatt_failure_rate),
+    }
+    socket_file = work_dir / messages.SOCKET_FILENAME
+    processes: dict[str, subprocess.Popen] = {}
+    try:
+        with open(work_dir / 'manager.log', 'wb') as log:
+            processes['manager'] = subprocess.Popen((sys.executable, str(source_dir / 'manager.py')),
+                                                    cwd=work_dir, env=env, stdout=log, stderr=log)
+        while not socket_file.exists():
+            await asyncio.sleep(0.1)
+        for i in range(options.testers):
+            with open(work_dir / f'tester-{i}.log', 'wb') as log:
+                processes[f'tester-{i}'] = subprocess.Popen(
+                    (sys.executable, str(source_dir / 'tester.py'), '-n', f'bench-{i}', '-a', options.arch, '-j', str(options.jobs)),
+                    cwd=work_dir, env=env, stdout=log, stderr=log)
+        while metric_sum((await manager_request(socket_file, messages.GetMetrics())).text, 'tattoo_testers_connected') < options.testers:
+            await asyncio.sleep(0.2)
+
+        bugs = list(range(FIRST_BUG, FIRST_BUG + options.bugs))
+        started = time.monotonic()
+        await manager_request(socket_file, messages.GlobalJob(bugs=bugs))
+        done = tatt_failed = 0
+        with sqlite3.connect(work_dir / 'tattoo.db') as conn:
+            while time.monotonic() - started < options.timeout:
+                await asyncio.sleep(0.5)
+                with contextlib.suppress(sqlite3.OperationalError):
+                    done = conn.execute('SELECT COUNT(*) FROM tests').fetchone()[0]
+                # bugs whose `pkgdev tatt` failed never reach the DB. Every tester gets all
+                # bugs, so the tester which went through the most has the best count.
+                text = (await manager_request(socket_file, messages.GetMetrics())).text
+                tatt_failed = round(max(metric_values(text, 'tattoo_jobs_total', 'result="tatt_failed"'), default=0))
+                if done + tatt_failed >= options.bugs:
+                    break
+        elapsed = time.monotonic() - started
+
+        await asyncio.sleep(2)  # wait for testers to push their final metrics
+        text = (await manager_request(socket_file, messages.GetMetrics())).text
+        queue_p50, queue_p95 = histogram_quantiles(text, 'tattoo_queue_wait_seconds', 0.5, 0.95)
+        dispatch_p50, dispatch_p95 = histogram_quantiles(text, 'tattoo_dispatch_seconds', 0.5, 0.95)
+        db_writes = metric_sum(text, 'tattoo_db_write_seconds_count')
+        db_write_time = metric_sum(text, 'tattoo_db_write_seconds_sum')
+        manager_messages = metric_sum(text, 'tattoo_manager_messages_total')
+        memory = {name: peak_memory_kb(proc.pid) for name, proc in processes.items()}
+        return {
+            'results in DB': f'{done} / {options.bugs - tatt_failed} in {elapsed:.1f}s ({tatt_failed} tatt failures)',
+            'throughput': f'{3600 * done / elapsed:.0f} bugs/hour',
+            'dispatch latency p50 / p95': f'{dispatch_p50:g}s / {dispatch_p95:g}s',
+            'queue wait p50 / p95': f'{queue_p50:g}s / {queue_p95:g}s',
+            'manager messages': f'{manager_messages / elapsed:.0f}/s',
+            'DB writes': f'{db_writes / elapsed:.0f}/s',
+            'DB write latency': f'{1000 * db_write_time / db_writes:.3f}ms' if db_writes else 'n/a',
+            'peak memory': ', '.join(f'{name} {kb / 1024:.1f}MiB' for name, kb in memory.items()),
+        }
+    finally:
+        for proc in processes.values():
+            proc.terminate()
+        for proc in processes.values():
+            proc.wait()
+
+
+def rate(count: int, func) -> str:
+    start = time.perf_counter()
+    func()
+    return f'{count / (time.perf_counter() - start):,.0f}/s'
+
+
+def micro_benchmarks(count: int, work_dir: Path) -> dict[str, str]:
+    results = {}
+
+    status = messages.ManagerStatus(load=(1.0, 1.0, 1.0), cpu_count=8, testers={
+        messages.Worker(name=f'bench-{i}', arch='amd64'): messages.TesterStatus(bugs_queue=tuple(range(100)), merging_atoms=())
+        for i in range(4)
+    })
+    job = messages.GlobalJob(bugs=list(range(FIRST_BUG, FIRST_BUG + 100)))
+    results['messages dump+load (BugJobDone)'] = rate(count, lambda: [
+        messages.load(messages.dump(messages.BugJobDone(bug_number=i, success=True))) for i in range(count)])
+    results['messages dump+load (GlobalJob x100)'] = rate(count, lambda: [
+        messages.load(messages.dump(job)) for _ in range(count)])
+    results['messages dump+load (ManagerStatus)'] = rate(count, lambda: [
+        messages.load(messages.dump(status)) for _ in range(count)])
+
+    async def queue_bench():
+        queue = BugsQueue()
+        for i in range(count):
+            queue.put_nowait(BugsQueueItem(bug=i, priority=i % 7))
+        _ = queue.bugs
+        for _ in range(count):
+            queue.bug_done(await queue.get())
+    results['BugsQueue put+get+done'] = rate(count, lambda: asyncio.run(queue_bench()))
+
+    DB.db_file = work_dir / 'micro.db'
+    db = DB()
+    worker = messages.Worker(name='bench', arch='amd64')
+    results['DB.report_job'] = rate(count, lambda: [
+        db.report_job(worker, messages.BugJobDone(bug_number=i, success=bool(i % 2))) for i in range(count)])
+    bugs = frozenset(range(count * 2))
+    results['DB.filter_not_tested'] = rate(100, lambda: [db.filter_not_tested('amd64', bugs) for _ in range(100)])
+
+    results['collect_bugs (all open bugs)'] = rate(10, lambda: [
+        list(bugs_fetcher.collect_bugs((), worker)) for _ in range(10)])
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--bugs', type=int, default=1000, help="Amount of bugs to test")
+    parser.add_argument('--testers', type=int, default=2, help="Amount of tester processes")
+    parser.add_argument('-j', '--jobs', type=int, default=4, help="Jobs of every tester")
+    parser.add_argument('--arch', default='amd64', help="Arch of the testers and bugs")
+    parser.add_argument('--build-seconds', type=float, default=0.2, help="Mean duration of a test run")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="Ratio of failing test runs")
+    parser.add_argument('--tatt-failure-rate', type=float, default=0, help="Ratio of failing `pkgdev tatt` runs")
+    parser.add_argument('--bugzilla-latency', type=float, default=0, help="Seconds every bugzilla request takes")
+    parser.add_argument('--timeout', type=float, default=600, help="Maximal seconds to wait for all results")
+    parser.add_argument('--micro-count', type=int, default=10000, help="Iterations of micro benchmarks")
+    parser.add_argument('--no-load-test', dest='load_test', action='store_false', help="Run only micro benchmarks")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='tattoo-bench-') as tmp:
+        work_dir = Path(tmp)
+        (work_dir / 'run').mkdir()
+        (work_dir / 'home').mkdir()
+        results = {}
+        if options.load_test:
+            results.update(asyncio.run(load_test(options, work_dir)))
+        results.update(micro_benchmarks(options.micro_count, work_dir))
+
+    width = max(map(len, results))
+    for name, value in results.items():
+        print(f'{name:<{width}}  {value}')
+
+
+if __name__ == '__main__':
+    main()
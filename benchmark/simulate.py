@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Discrete event simulator replaying historical test runs against the dispatch logic.
+
+Test runs and build durations are read from the manager's ``tests`` table,
+together with the archived ``{bug}.report`` files (the start time of a run is
+the ``# time:`` header of its report). Neither records when a bug was
+submitted, so every run arrives at its historical start time, and the queueing
+it saw in production isn't part of the replayed time-to-result. The results are
+therefore only meaningful relative to each other, for comparing testers,
+policies and scan intervals over the same trace. The trace is replayed against
+``BugsQueue`` per tester, with the manager's dispatch (``process_bugs`` sends a
+bug to every tester of the arch, ``do_scan`` runs every scan interval, skips
+while tester queues aren't empty and doesn't resend tested bugs), and reports
+time-to-result percentiles and slots utilisation for the chosen policies.
+"""
+
+import heapq
+import itertools
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from bugs_queue import BugsQueue, BugsQueueItem
+
+
+class TraceItem(NamedTuple):
+    # historical start of the run, as the submission time isn't recorded
+    arrival: float
+    bug: int
+    arch: str
+    duration: float
+
+
+def parse_time(value: str) -> float:
+    return datetime.fromisoformat(value.strip()).timestamp()
+
+
+def report_start(report_file: Path) -> float | None:
+    try:
+        with report_file.open(encoding='utf8') as file:
+            for line in file:
+                if line.startswith('# time:'):
+                    return parse_time(line.removeprefix('# time:'))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_trace(db_file: Path, reports_dir: Path | None, default_duration: float) -> list[TraceItem]:
+    trace = []
+    with sqlite3.connect(db_file) as conn:
+        for arch, bug_no, time_date in conn.execute('SELECT arch, bug_no, time_date FROM tests'):
+            finished = parse_time(time_date)
+            started = report_start(reports_dir / f'{bug_no}.report') if reports_dir else None
+            duration = finished - started if started is not None and started <= finished else default_duration
+            trace.append(TraceItem(arrival=finished - duration, bug=bug_no, arch=arch, duration=duration))
+    trace.sort()
+    if trace:
+        start = trace[0].arrival
+        trace = [item._replace(arrival=item.arrival - start) for item in trace]
+    return trace
+
+
+PriorityPolicy = Callable[[TraceItem, bool], int]
+
+POLICIES: dict[str, PriorityPolicy] = {
+    # as the manager does: manual submissions before scanned bugs
+    'manager': lambda item, scanned: 100 if scanned else 0,
+    'fifo': lambda item, scanned: 0,
+    # oracle policy, as the real duration isn't known in advance
+    'shortest-first': lambda item, scanned: int(item.duration // 60),
+}
+
+
+class Tester:
+    def __init__(self, name: str, arch: str, jobs: int):
+        self.name = name
+        self.arch = arch
+        self.jobs = jobs
+        self.queue = BugsQueue()
+        self.busy_time = 0.0
+
+    @property
+    def load(self) -> int:
+        return len(self.queue.running) + self.queue.qsize()
+
+
+class Simulator:
+    def __init__(self, trace: list[TraceItem], testers: list[Tester], policy: PriorityPolicy,
+                 scan_interval: float | None, shard: bool):
+        self.trace = {(item.bug, item.arch): item for item in trace}
+        self.testers = testers
+        self.policy = policy
+        self.scan_interval = scan_interval
+        self.shard = shard
+        self.events: list[tuple[float, int, str, object]] = []
+        self.counter = itertools.count()
+        self.now = 0.0
+        self.pending: list[TraceItem] = []
+        self.done: dict[tuple[int, str], float] = {}
+        self.runs = 0
+
+    def schedule(self, time: float, kind: str, payload: object = None):
+        heapq.heappush(self.events, (time, next(self.counter), kind, payload))
+
+    def dispatch(self, item: TraceItem, scanned: bool):
+        if not (targets := [tester for tester in self.testers if tester.arch.removeprefix('~') == item.arch]):
+            return
+        if self.shard:
+            targets = [min(targets, key=lambda tester: tester.load / tester.jobs)]
+        for tester in targets:
+            if item.bug not in tester.queue.bugs and item.bug not in tester.queue.running:
+                tester.queue.put_nowait(BugsQueueItem(bug=item.bug, priority=self.policy(item, scanned)))
+                self.start_jobs(tester)
+
+    def start_jobs(self, tester: Tester):
+        while len(tester.queue.running) < tester.jobs and not tester.queue.empty():
+            bug_no = tester.queue.get_nowait()
+            item = self.trace[(bug_no, tester.arch.removeprefix('~'))]
+            self.runs += 1
+            tester.busy_time += item.duration
+            self.schedule(self.now + item.duration, 'finish', (tester, item))
+
+    def scan(self):
+        if not any(tester.load for tester in self.testers):
+            for item in self.pending:
+                if (item.bug, item.arch) not in self.done:
+                    self.dispatch(item, scanned=True)
+            self.pending.clear()
+        if any(item for item in self.events if item[2] != 'scan') or self.pending:
+            self.schedule(self.now + self.scan_interval, 'scan')
+
+    def run(self) -> float:
+        for item in self.trace.values():
+            self.schedule(item.arrival, 'arrival', item)
+        if self.scan_interval:
+            self.schedule(self.scan_interval, 'scan')
+        while self.events:
+            self.now, _, kind, payload = heapq.heappop(self.events)
+            if kind == 'arrival':
+                if self.scan_interval:
+                    self.pending.append(payload)
+                else:
+                    self.dispatch(payload, scanned=False)
+            elif kind == 'finish':
+                tester, item = payload
+                tester.queue.bug_done(item.bug)
+                self.done.setdefault((item.bug, item.arch), self.now)
+                self.start_jobs(tester)
+            elif kind == 'scan':
+                self.scan()
+        return self.now
+
+    def results(self) -> Iterator[float]:
+        for key, finished in self.done.items():
+            yield finished - self.trace[key].arrival
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    return values[min(len(values) - 1, int(ratio * len(values)))] if values else float('nan')
+
+
+def parse_testers(value: str) -> tuple[str, int, int]:
+    """Parse ``ARCH=COUNTxJOBS``, for example ``amd64=2x4``."""
+    arch, spec = value.split('=', maxsplit=1)
+    count, _, jobs = spec.partition('x')
+    return arch, int(count), int(jobs or 1)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--db', type=Path, default=Path('tattoo.db'), help="Manager's DB to read the trace from")
+    parser.add_argument('--reports', type=Path, help="Directory with archived {bug}.report files")
+    parser.add_argument('--default-duration', type=float, default=3600,
+                        help="Duration in seconds for runs without a report file")
+    parser.add_argument('--testers', type=parse_testers, action='append', default=[], metavar='ARCH=COUNTxJOBS',
+                        help="Testers to simulate, by default one tester with one job per arch in the trace")
+    parser.add_argument('--policy', choices=POLICIES, default='manager', help="Priority policy of the queues")
+    parser.add_argument('--scan-interval', type=float, default=None,
+                        help="Dispatch arrivals only through scans every given seconds (auto_scan uses 14400)")
+    parser.add_argument('--shard', action='store_true',
+                        help="Send every bug to the least loaded tester of the arch, instead of all of them")
+    options = parser.parse_args()
+
+    trace = read_trace(options.db, options.reports, options.default_duration)
+    if not trace:
+        parser.error(f'no test runs found in {options.db}')
+    specs = options.testers or [(arch, 1, 1) for arch in sorted({item.arch for item in trace})]
+    testers = [Tester(f'{arch}-{i}', arch, jobs) for arch, count, jobs in specs for i in range(count)]
+
+    simulator = Simulator(trace, testers, POLICIES[options.policy], options.scan_interval, options.shard)
+    makespan = simulator.run()
+    results = sorted(simulator.results())
+
+    print(f'results:          {len(trace)} ({simulator.runs} runs)')
+    print(f'makespan:         {makespan / 3600:.2f}h')
+    for ratio in (0.5, 0.9, 0.99):
+        print(f'time-to-result p{int(ratio * 100):<2} {percentile(results, ratio) / 3600:.2f}h')
+    for tester in testers:
+        utilisation = tester.busy_time / (tester.jobs * makespan) if makespan else 0
+        print(f'utilisation {tester.name}: {100 * utilisation:.1f}%')
+
+
+if __name__ == '__main__':
+    main()
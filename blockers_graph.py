@@ -0,0 +1,95 @@
+from typing import Iterable, NamedTuple
+
+
+class ReleasedBug(NamedTuple):
+    bug: int
+    priority: int
+    blockers: frozenset[int]
+
+
+class BlockersGraph:
+    """Bugs waiting for their blockers to be done on an arch.
+
+    Arches are tester arches, so ``~arm64`` (keywording) is separate from
+    ``arm64`` (stabilization).
+    """
+
+    def __init__(self):
+        # (bug, arch) -> all blockers the bug waited for
+        self.blockers: dict[tuple[int, str], frozenset[int]] = {}
+        # (bug, arch) -> blockers not done yet
+        self.pending: dict[tuple[int, str], set[int]] = {}
+        # (blocker, arch) -> bugs waiting for it
+        self.dependents: dict[tuple[int, str], set[int]] = {}
+        # arch -> blockers which were done, until the next refresh
+        self.done: dict[str, set[int]] = {}
+
+    def add(self, bug: int, arch: str, blockers: Iterable[int]) -> list[ReleasedBug]:
+        """Record that ``bug`` waits for ``blockers`` on ``arch``.
+
+        Returns the bug as released if all of its blockers are already done.
+        """
+        self.discard(bug, arch)
+        blockers = frozenset(blockers)
+        if not (pending := set(blockers).difference(self.done.get(arch, ()))):
+            return [ReleasedBug(bug, 0, blockers)]
+        self.blockers[(bug, arch)] = blockers
+        self.pending[(bug, arch)] = pending
+        for blocker in pending:
+            self.dependents.setdefault((blocker, arch), set()).add(bug)
+        return []
+
+    def discard(self, bug: int, arch: str):
+        self.blockers.pop((bug, arch), None)
+        for blocker in self.pending.pop((bug, arch), ()):
+            if dependents := self.dependents.get((blocker, arch)):
+                dependents.discard(bug)
+                if not dependents:
+                    del self.dependents[(blocker, arch)]
+
+    def blocker_done(self, blocker: int, arch: str) -> list[ReleasedBug]:
+        """Mark ``blocker`` as done on ``arch``, and return the bugs which aren't blocked anymore.
+
+        Released bugs are ordered by the length of the chain of bugs waiting
+        for them, with matching (lower first) priorities, so the bugs which
+        unblock longer chains are tested first.
+        """
+        self.done.setdefault(arch, set()).add(blocker)
+        released = []
+        for bug in self.dependents.pop((blocker, arch), ()):
+            pending = self.pending[(bug, arch)]
+            pending.discard(blocker)
+            if not pending:
+                del self.pending[(bug, arch)]
+                blockers = self.blockers.pop((bug, arch))
+                released.append(ReleasedBug(bug, -self.chain_length(bug, arch), blockers))
+        return sorted(released, key=lambda item: item.priority)
+
+    def chain_length(self, bug: int, arch: str, visiting: frozenset[int] = frozenset()) -> int:
+        """Length of the longest chain of bugs waiting (transitively) for ``bug``."""
+        visiting = visiting | {bug}
+        return max((
+            1 + self.chain_length(dependent, arch, visiting)
+            for dependent in self.dependents.get((bug, arch), ())
+            if dependent not in visiting
+        ), default=0)
+
+    def refresh(self, blockers_arches: dict[int, frozenset[str]]) -> dict[str, list[ReleasedBug]]:
+        """Mark blockers as done on arches no longer CCed, or if they are resolved (missing).
+
+        ``blockers_arches`` holds the CCed arches of every unresolved blocker.
+        Done blockers nobody waits for are forgotten, as new bugs are checked
+        against the passed tests in the DB anyway.
+        """
+        self.done = {arch: kept for arch, done in self.done.items() if (kept := done.intersection(blockers_arches))}
+        released: dict[str, list[ReleasedBug]] = {}
+        for blocker, arch in tuple(self.dependents):
+            if arch.removeprefix('~') not in blockers_arches.get(blocker, ()):
+                released.setdefault(arch, []).extend(self.blocker_done(blocker, arch))
+        return released
+
+    def waiting_blockers(self) -> frozenset[int]:
+        return frozenset(blocker for blocker, _ in self.dependents)
+
+    def __len__(self):
+        return len(self.pending)
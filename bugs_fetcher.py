@@ -8,6 +8,9 @@ except ImportError:
     MANUAL_TESTING = 'Manual'
 
 import messages
+from metrics import Histogram
+
+BUGZILLA_REQUEST = Histogram('tattoo_bugzilla_request_seconds', 'Latency of bugzilla requests')
 
 def read_api_key():
     try:
@@ -18,37 +21,66 @@ def read_api_key():
 
 nattka_bugzilla = NattkaBugzilla(api_key=read_api_key())
 
-def check_bug(bug: BugInfo, depends_bugs: dict[int, BugInfo], worker: messages.Worker) -> bool:
+def pending_blockers(bug: BugInfo, depends_bugs: dict[int, BugInfo], worker: messages.Worker,
+                     done_blockers: frozenset[int] = frozenset()) -> frozenset[int] | None:
+    """Return the blockers which still have the worker's arch, or None if the bug isn't testable."""
     if getattr(bug, 'runtime_testing_required', None) == MANUAL_TESTING:
-        return False
+        return None
     if (bug.category == BugCategory.KEYWORDREQ) != worker.is_rekeyword():
-        return False
-    for dep in bug.depends:
-        if dep := depends_bugs.get(dep):
+        return None
+    pending = set()
+    for dep_no in bug.depends:
+        if dep_no in done_blockers:
+            continue
+        if dep := depends_bugs.get(dep_no):
             if dep.category not in (BugCategory.KEYWORDREQ, BugCategory.STABLEREQ):
                 # if not another keyword/stable request, then it has a blocker bug
-                return False
+                return None
             if not dep.sanity_check or "CC-ARCHES" not in dep.keywords:
                 # if the blocker is not ready, then this one is also not ready
-                return False
+                return None
             if worker.canonical_arch() in (cc.removesuffix('@gentoo.org') for cc in dep.cc):
                 # if any of the blockers has the arch, then it's not ready
-                return False
-    return True
+                pending.add(dep_no)
+    return frozenset(pending)
 
-def collect_bugs(bugs_no: Iterable[int], *workers: messages.Worker) -> Iterator[tuple[messages.Worker, list[int]]]:
-    bugs = nattka_bugzilla.find_bugs(
-        bugs=bugs_no,
-        unresolved=True,
-        sanity_check=[True],
-        cc={f'{worker.canonical_arch()}@gentoo.org' for worker in workers},
-    )
+def collect_bugs(bugs_no: Iterable[int], *workers: messages.Worker, done_blockers: frozenset[int] = frozenset(),
+                 blocked: dict[messages.Worker, dict[int, frozenset[int]]] | None = None) -> Iterator[tuple[messages.Worker, list[int]]]:
+    """Yield the testable bugs for every worker.
+
+    Bugs waiting only for blockers which still have the worker's arch are
+    filled into ``blocked``, if given. Blockers in ``done_blockers`` are
+    considered done for the arch.
+    """
+    with BUGZILLA_REQUEST.time(call='find_bugs'):
+        bugs = nattka_bugzilla.find_bugs(
+            bugs=bugs_no,
+            unresolved=True,
+            sanity_check=[True],
+            cc={f'{worker.canonical_arch()}@gentoo.org' for worker in workers},
+        )
 
     if all_depends := frozenset().union(*(bug.depends for bug in bugs.values())):
-        depends_bugs = nattka_bugzilla.find_bugs(bugs=all_depends, unresolved=True)
+        with BUGZILLA_REQUEST.time(call='find_depends'):
+            depends_bugs = nattka_bugzilla.find_bugs(bugs=all_depends, unresolved=True)
     else:
         depends_bugs = {}
 
     for worker in workers:
-        if ok_bugs := [bug_no for bug_no, bug in bugs.items() if check_bug(bug, depends_bugs, worker)]:
+        ok_bugs = []
+        for bug_no, bug in bugs.items():
+            if (pending := pending_blockers(bug, depends_bugs, worker, done_blockers)) == frozenset():
+                ok_bugs.append(bug_no)
+            elif pending and blocked is not None:
+                blocked.setdefault(worker, {})[bug_no] = pending
+        if ok_bugs:
             yield worker, ok_bugs
+
+def blockers_arches(blockers: Iterable[int]) -> dict[int, frozenset[str]]:
+    """Return the CCed arches of every unresolved blocker."""
+    with BUGZILLA_REQUEST.time(call='find_blockers'):
+        bugs = nattka_bugzilla.find_bugs(bugs=blockers, unresolved=True)
+    return {
+        bug_no: frozenset(cc.removesuffix('@gentoo.org') for cc in bug.cc)
+        for bug_no, bug in bugs.items()
+    }
@@ -1,8 +1,14 @@
-from asyncio import Queue
+from asyncio import Queue, TimerHandle, get_running_loop
 from heapq import heappop, heappush
 from itertools import count
+from time import monotonic
 from typing import NamedTuple
 
+from metrics import Histogram
+from rate_limit import backoff_delay
+
+QUEUE_WAIT = Histogram('tattoo_queue_wait_seconds', 'Time bugs wait in the tester queue before starting')
+
 
 class BugsQueueInnerItem(NamedTuple):
     priority: int
@@ -16,21 +22,52 @@ class BugsQueueItem(NamedTuple):
 
 
 class BugsQueue(Queue):
+    max_attempts = 6
+
     def _init(self, maxsize: int):
         self._queue: list[BugsQueueInnerItem] = []
         self.counter = count()
         self.running: list[int] = []
+        self.priorities: dict[int, int] = {}
+        self.attempts: dict[int, int] = {}
+        self.delayed: dict[int, TimerHandle] = {}
+        self.queued_at: dict[int, float] = {}
 
     def _get(self) -> int:
         bug_no = heappop(self._queue).bug
         self.running.append(bug_no)
+        if (queued_at := self.queued_at.pop(bug_no, None)) is not None:
+            QUEUE_WAIT.observe(monotonic() - queued_at)
         return bug_no
 
     def _put(self, item: BugsQueueItem):
+        self.priorities[item.bug] = item.priority
+        self.queued_at[item.bug] = monotonic()
         heappush(self._queue, BugsQueueInnerItem(**item._asdict(), count=next(self.counter)))
 
+    def retry_later(self, bug_no: int) -> float | None:
+        """Put a running bug back into the queue after a backoff delay.
+
+        Returns the delay, or None if the bug ran out of attempts.
+        """
+        attempt = self.attempts.get(bug_no, 0)
+        if attempt >= self.max_attempts:
+            return None
+        self.attempts[bug_no] = attempt + 1
+        delay = backoff_delay(attempt)
+        item = BugsQueueItem(bug=bug_no, priority=self.priorities[bug_no])
+        self.delayed[bug_no] = get_running_loop().call_later(delay, self._retry, item)
+        return delay
+
+    def _retry(self, item: BugsQueueItem):
+        del self.delayed[item.bug]
+        self.put_nowait(item)
+
     def bug_done(self, bug_no: int):
         self.running.remove(bug_no)
+        if bug_no not in self.delayed:
+            self.priorities.pop(bug_no, None)
+            self.attempts.pop(bug_no, None)
         return super().task_done()
 
     @property
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import messages
+
+CCACHE_DIR = Path(os.getenv('TATTOO_CCACHE_DIR', '/var/cache/ccache/tattoo'))
+CCACHE_SIZE = os.getenv('TATTOO_CCACHE_SIZE', '5G')
+ENV_FILE = Path('/etc/portage/env/tattoo-ccache.conf')
+
+CCACHE_SUFFIXES = {'K': 10**3, 'M': 10**6, 'G': 10**9, 'T': 10**12,
+                   'KI': 1 << 10, 'MI': 1 << 20, 'GI': 1 << 30, 'TI': 1 << 40}
+
+
+def parse_ccache_size(value: str) -> int:
+    """Parse a size as ccache does for ``max_size``: ``G`` is 10^9 and ``Gi`` is 2^30, no suffix means ``G``."""
+    value = value.strip().upper().removesuffix('B')
+    number = value.rstrip('KMGTI')
+    return int(float(number) * CCACHE_SUFFIXES.get(value[len(number):] or 'G'))
+
+
+def current_profile() -> str:
+    """Return the portage profile of this host, like ``default/linux/amd64/23.0``."""
+    if not os.path.exists(profile := os.path.realpath('/etc/portage/make.profile')):
+        return 'unknown'
+    return profile.partition('/profiles/')[2] or os.path.basename(profile)
+
+
+class Ccache:
+    """Compiler cache shared by all jobs of the same arch and profile.
+
+    Jobs opt in through the ``tattoo-ccache.conf`` env file, which is passed
+    to ``pkgdev tatt`` and so is listed in every per job ``package.env``.
+    """
+
+    def __init__(self, arch: str, max_size: str = CCACHE_SIZE):
+        self.cache_dir = CCACHE_DIR / arch.removeprefix('~') / current_profile().replace('/', '_')
+        self.max_size = max_size
+        self.stats: messages.CcacheStats | None = None
+
+    @staticmethod
+    def available() -> bool:
+        return shutil.which('ccache') is not None
+
+    def setup(self) -> str:
+        """Create the cache and its env file, and return the env file name for ``pkgdev tatt``."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        (self.cache_dir / 'ccache.conf').write_text(
+            f'max_size = {self.max_size}\n'
+            # portage builds as the portage user, while cleanup runs as root
+            'umask = 002\n'
+        )
+        try:
+            shutil.chown(self.cache_dir, group='portage')
+            self.cache_dir.chmod(0o2775)
+        except (OSError, LookupError) as exc:
+            logging.warning('failed setting permissions of %s', self.cache_dir, exc_info=exc)
+        ENV_FILE.parent.mkdir(parents=True, exist_ok=True)
+        ENV_FILE.write_text(
+            'FEATURES="${FEATURES} ccache"\n'
+            f'CCACHE_DIR="{self.cache_dir}"\n'
+        )
+        return ENV_FILE.name
+
+    async def ccache(self, *args: str) -> str:
+        proc = await asyncio.create_subprocess_exec(
+            'ccache', *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=os.environ | {'CCACHE_DIR': str(self.cache_dir)},
+        )
+        stdout, _ = await proc.communicate()
+        return stdout.decode()
+
+    async def update_stats(self) -> messages.CcacheStats | None:
+        try:
+            stats = dict(
+                line.split('\t', maxsplit=1)
+                for line in (await self.ccache('--print-stats')).splitlines()
+                if '\t' in line
+            )
+            self.stats = messages.CcacheStats(
+                hits=int(stats.get('direct_cache_hit', 0)) + int(stats.get('preprocessed_cache_hit', 0)),
+                misses=int(stats.get('cache_miss', 0)),
+                size=1024 * int(stats.get('cache_size_kibibyte', 0)),
+                max_size=parse_ccache_size(self.max_size),
+            )
+        except Exception as exc:
+            logging.error('failed reading ccache stats', exc_info=exc)
+        return self.stats
+
+    async def run(self, interval: float = 3600):
+        """Periodically trim the cache to its size cap and refresh the stats."""
+        while True:
+            try:
+                await self.ccache('--cleanup')
+            except Exception as exc:
+                logging.error('ccache cleanup failed', exc_info=exc)
+            await self.update_stats()
+            await asyncio.sleep(interval)
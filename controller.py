@@ -7,17 +7,21 @@ import logging
 import os
 import subprocess
 from argparse import ArgumentError, ArgumentParser
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime, UTC
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
 
 import messages
+from rate_limit import TokenBucket
 from sdnotify import set_logging_format
+from transport import open_tcp_connection
 
 set_logging_format()
 
 try:
-    from nattka.bugzilla import BugCategory, NattkaBugzilla, arches_from_cc
+    from nattka.bugzilla import BugCategory, BugInfo, NattkaBugzilla, arches_from_cc
     from nattka.git import GitWorkTree, GitCommitNoChanges, git_commit
     from nattka.package import (PackageListDoneAlready, KeywordNoneLeft, add_keywords,
                                 find_repository, match_package_list)
@@ -29,6 +33,12 @@ base_dir = Path('/tmp/tattoo')
 comm_dir = base_dir / 'comm'
 fetch_datetime_file = Path.cwd() / 'controller.datetime.txt'
 
+# the controller's own budget, not shared with any manager
+bugzilla_bucket = TokenBucket(
+    rate=float(os.getenv('CONTROLLER_BUGZILLA_RATE', '5')),
+    burst=float(os.getenv('CONTROLLER_BUGZILLA_BURST', '10')),
+)
+
 
 def chunks(iterable, size):
     iterator = iter(iterable)
@@ -45,6 +55,18 @@ def collect_ssh_hosts() -> set[str]:
         }
 
 
+def collect_tcp_managers() -> dict[str, str]:
+    """Read managers reachable over TCP, as ``name host:port`` lines of the ``tcp_managers`` file."""
+    managers = {}
+    with contextlib.suppress(FileNotFoundError):
+        with open(Path.cwd() / 'tcp_managers', encoding='utf8') as file:
+            for row in file:
+                if (row := row.partition('#')[0].strip()):
+                    name, address = row.split(maxsplit=1)
+                    managers[name] = address.strip()
+    return managers
+
+
 def read_fetch_datetimes() -> dict[str, datetime]:
     res = {}
     with contextlib.suppress(Exception):
@@ -104,7 +126,45 @@ async def disconnect(targets: str):
         (base_dir / 'control' / host).unlink(missing_ok=True)
 
 
-def apply_passes(passes: list[tuple[int, str]]):
+def fetch_bugs_info(nattka_bugzilla: 'NattkaBugzilla', bugs: Iterable[int], jobs: int) -> dict[int, 'BugInfo']:
+    def find_bugs(chunk: tuple[int, ...]) -> dict[int, 'BugInfo']:
+        bugzilla_bucket.acquire_blocking()
+        return nattka_bugzilla.find_bugs(bugs=chunk)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(itertools.chain.from_iterable(
+            result.items()
+            for result in executor.map(find_bugs, chunks(bugs, 40))
+        ))
+
+
+def resolve_bug(nattka_bugzilla: 'NattkaBugzilla', bug_no: int, bug: 'BugInfo', bug_cc: list[str], done: list[str]) -> bool:
+    allarches = 'ALLARCHES' in bug.keywords
+    to_remove = bug_cc if allarches else done
+    all_done = allarches or set(bug_cc) <= set(done)
+    if allarches:
+        comment = " ".join(f'[{a}]' if a in done else a for a in to_remove)
+        comment += " (ALLARCHES) done"
+    else:
+        comment = f'{" ".join(done)} done'
+    if all_done:
+        comment += '\n\nall arches done'
+    try:
+        bugzilla_bucket.acquire_blocking()
+        nattka_bugzilla.resolve_bug(
+            bugno=bug_no,
+            uncc=(f'{arch}@gentoo.org' for arch in to_remove),
+            comment=comment,
+            resolve=all_done and not bug.security
+        )
+        logging.info("resolved %d,%s", bug_no, ','.join(done))
+        return True
+    except Exception as exc:
+        logging.error("failed to resolve %d,%s", bug_no, ','.join(done), exc_info=exc)
+        return False
+
+
+def apply_passes(passes: list[tuple[int, str]]) -> Counter[str]:
     if api_key := os.getenv('ARCHTESTER_BUGZILLA_APIKEY'):
         nattka_bugzilla = NattkaBugzilla(api_key=api_key)
     else:
@@ -112,104 +172,476 @@ def apply_passes(passes: list[tuple[int, str]]):
     _, repo = find_repository(OPTIONS.fetch_repo)
     git_repo = GitWorkTree(OPTIONS.fetch_repo)
 
-    divided = {bug_no: frozenset(a for x, a in passes if x == bug_no) for bug_no, _ in passes}
+    divided: dict[int, set[str]] = {}
+    for bug_no, arch in passes:
+        divided.setdefault(bug_no, set()).add(arch)
 
-    bugs_info = itertools.chain.from_iterable(
-        nattka_bugzilla.find_bugs(bugs=bugs).items()
-        for bugs in chunks(divided.keys(), 40)
-    )
+    bugs_info = fetch_bugs_info(nattka_bugzilla, divided.keys(), OPTIONS.fetch_jobs)
+    summary: Counter[str] = Counter()
 
-    for bug_no, bug in bugs_info:
-        bug_cc = list(arches_from_cc(bug.cc, repo.known_arches))
-        for arch in divided[bug_no]:
-            if arch not in bug_cc:
+    with ThreadPoolExecutor(max_workers=OPTIONS.fetch_jobs) as executor:
+        resolving: list[Future[bool]] = []
+        for index, (bug_no, bug) in enumerate(bugs_info.items(), start=1):
+            logging.info("applying %d [%d/%d]", bug_no, index, len(bugs_info))
+            bug_cc = list(arches_from_cc(bug.cc, repo.known_arches))
+            if not (arches := sorted(divided[bug_no].intersection(bug_cc))):
                 continue
             try:
-                plist = dict(match_package_list(repo, bug, only_new=True, filter_arch=[arch], permit_allarches=True))
+                plist = dict(match_package_list(repo, bug, only_new=True, filter_arch=arches, permit_allarches=True))
                 allarches = 'ALLARCHES' in bug.keywords
                 add_keywords(plist.items(), bug.category == BugCategory.STABLEREQ)
+                done: set[str] = set()
                 for pkg, keywords in plist.items():
-                    if arch not in keywords:
+                    if not (pkg_arches := [arch for arch in arches if arch in keywords]):
                         continue
 
                     ebuild_path = Path(pkg.path).relative_to(repo.location)
                     pfx = f'{pkg.category}/{pkg.package}'
                     act = ('Stabilize' if bug.category == BugCategory.STABLEREQ else 'Keyword')
-                    kws = 'ALLARCHES' if allarches else arch
+                    kws = 'ALLARCHES' if allarches else ' '.join(pkg_arches)
                     msg = f'{pfx}: {act} {pkg.fullver} {kws}, #{bug_no}'
                     print(git_commit(git_repo.path, msg, [str(ebuild_path)]))
-                if OPTIONS.fetch_resolve:
-                    to_remove = bug_cc if allarches else [arch]
-                    all_done = len(bug_cc) == 1 or allarches
-                    to_close = all_done and not bug.security
-                    if allarches:
-                        comment = " ".join(f'[{a}]' if a == arch else a for a in to_remove)
-                        comment += " (ALLARCHES) done"
-                    else:
-                        comment = f'{arch} done'
-                    if all_done:
-                        comment += '\n\nall arches done'
-                    nattka_bugzilla.resolve_bug(
-                        bugno=bug_no,
-                        uncc=(f'{arch}@gentoo.org' for arch in to_remove),
-                        comment=comment,
-                        resolve=to_close
-                    )
-                    logging.info("processed %d,%s", bug_no, arch)
-                    for a in to_remove:
-                        bug_cc.remove(a)
+                    summary['commits'] += 1
+                    done.update(pkg_arches)
+                if OPTIONS.fetch_resolve and done:
+                    resolving.append(executor.submit(resolve_bug, nattka_bugzilla, bug_no, bug, bug_cc, sorted(done)))
             except (PackageListDoneAlready, GitCommitNoChanges, KeywordNoneLeft):
-                logging.warning("skipping %d,%s as it was already done", bug_no, arch)
+                logging.warning("skipping %d,%s as it was already done", bug_no, ','.join(arches))
+                summary['skipped'] += 1
             except Exception as exc:
-                logging.error("failed to apply for %d,%s", bug_no, arch, exc_info=exc)
+                logging.error("failed to apply for %d,%s", bug_no, ','.join(arches), exc_info=exc)
+                summary['failed'] += 1
+
+        for result in as_completed(resolving):
+            if result.result():
+                summary['resolved'] += 1
+            else:
+                summary['failed'] += 1
+
+    print(f"Applied {len(bugs_info)} bugs: {summary['commits']} commits, {summary['resolved']} resolved, "
+          f"{summary['skipped']} skipped, {summary['failed']} failed")
+    return summary
+
+
+class ManagerLink:
+    """Connection to a single manager, through the forwarded unix socket."""
+
+    def __init__(self, name: str, socket_file: Path):
+        self.name = name
+        self.socket_file = socket_file
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def available(self) -> bool:
+        return self.socket_file.exists()
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(path=self.socket_file)
+        await self.send(messages.Worker(name='', arch=''))
+
+    async def send(self, obj):
+        async with self.lock:
+            await self._send(obj)
+
+    async def request(self, obj):
+        async with self.lock:
+            await self._send(obj)
+            try:
+                return messages.load(await self.reader.readuntil(b'\n'))
+            except BaseException:
+                # a partially read reply would desync the connection
+                await self.close()
+                raise
+
+    async def _send(self, obj):
+        if not self.connected:
+            raise ConnectionError(f'[{self.name}] is not connected')
+        self.writer.write(messages.dump(obj))
+        await self.writer.drain()
+
+    async def close(self):
+        if writer := self.writer:
+            self.writer = None
+            with contextlib.suppress(Exception):
+                writer.close()
+                await writer.wait_closed()
+
+
+class TcpLink(ManagerLink):
+    """Connection to a single manager over TLS, with concurrent requests multiplexed on it.
+
+    Falls back to the SSH forwarded unix socket, when the manager isn't
+    reachable over TCP.
+    """
+
+    def __init__(self, name: str, address: str):
+        super().__init__(name, comm_dir / name)
+        self.address = address
+        self.ids = itertools.count()
+        self.pending: dict[int, asyncio.Future] = {}
+        self.dispatcher: asyncio.Task | None = None
+
+    def available(self) -> bool:
+        return True
+
+    async def open(self):
+        self.dispatcher = None
+        try:
+            self.reader, self.writer = await open_tcp_connection(self.address)
+        except OSError as exc:
+            if not self.socket_file.exists():
+                raise
+            logging.warning("[%s] TCP connection failed (%s), falling back to SSH", self.name, exc)
+            await super().open()
+            return
+        await self.send(messages.Worker(name='', arch=''))
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def dispatch(self):
+        try:
+            while data := await self.reader.readuntil(b'\n'):
+                reply = messages.load(data)
+                if isinstance(reply, messages.Reply) and (future := self.pending.pop(reply.id, None)):
+                    if not future.done():
+                        future.set_result(reply.result)
+        except (asyncio.IncompleteReadError, OSError) as exc:
+            logging.warning("[%s] connection lost (%s)", self.name, exc)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f'[{self.name}] connection lost'))
+            self.pending.clear()
+            if writer := self.writer:
+                self.writer = None
+                writer.close()
+
+    async def request(self, obj):
+        if self.dispatcher is None:
+            return await super().request(obj)
+        request_id = next(self.ids)
+        self.pending[request_id] = future = asyncio.get_running_loop().create_future()
+        try:
+            await self.send(messages.Request(id=request_id, request=obj))
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def close(self):
+        if dispatcher := self.dispatcher:
+            self.dispatcher = None
+            dispatcher.cancel()
+        await super().close()
+
+
+class DaemonLink(ManagerLink):
+    """Connection to a single manager, through the running controller daemon."""
+
+    def __init__(self, name: str):
+        super().__init__(name, daemon_socket)
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(path=self.socket_file)
+
+    async def send(self, obj):
+        await self._forward(obj, reply=False)
+
+    async def request(self, obj):
+        return await self._forward(obj, reply=True)
+
+    async def _forward(self, obj, reply: bool):
+        result = await super().request(messages.ControllerForward(host=self.name, request=obj, reply=reply))
+        if result.error:
+            raise ConnectionError(f'[{self.name}] {result.error}')
+        return result.result
+
+
+async def daemon_request(obj):
+    reader, writer = await asyncio.open_unix_connection(path=daemon_socket)
+    try:
+        writer.write(messages.dump(obj))
+        await writer.drain()
+        return messages.load(await reader.readuntil(b'\n'))
+    finally:
+        with contextlib.suppress(Exception):
+            writer.close()
+            await writer.wait_closed()
 
 
-async def manager_communicate(socket_file: Path):
-    if not socket_file.exists():
-        logging.error("No such socket %s", socket_file)
+async def open_links() -> list[ManagerLink]:
+    if daemon_socket.exists():
+        try:
+            hosts = await daemon_request(messages.ControllerHosts())
+            logging.info("Using controller daemon")
+            return [DaemonLink(host) for host in hosts]
+        except OSError:
+            logging.warning("Stale controller daemon socket %s", daemon_socket)
+    tcp_managers = collect_tcp_managers()
+    links: list[ManagerLink] = [TcpLink(name, address) for name, address in tcp_managers.items()]
+    if comm_dir.exists():
+        links += [ManagerLink(socket_file.name, socket_file) for socket_file in comm_dir.iterdir()
+                  if socket_file.name not in tcp_managers]
+    return links
+
+
+async def manager_communicate(link: ManagerLink):
+    if not link.available():
+        logging.error("No such socket %s", link.socket_file)
         return
     try:
-        reader, writer = await asyncio.open_unix_connection(path=socket_file)
+        async with asyncio.timeout(OPTIONS.timeout):
+            await link.open()
     except Exception as exc:
-        logging.error("Failed Connect to [%s]", socket_file.name, exc_info=exc)
+        logging.error("Failed Connect to [%s]", link.name, exc_info=exc)
         return
 
     def matches_options(options: str|None) -> bool:
-        return bool(options) and (options == '*' or socket_file.name in options.split(','))
+        return bool(options) and (options == '*' or link.name in options.split(','))
 
     try:
-        writer.write(messages.dump(messages.Worker(name='', arch='')))
-        if OPTIONS.bugs:
-            writer.write(messages.dump(messages.GlobalJob(priority=OPTIONS.priority, bugs=OPTIONS.bugs)))
-        if matches_options(OPTIONS.scan):
-            writer.write(messages.dump(messages.DoScan()))
-            logging.info("Initiated scan for [%s]", socket_file.name)
-        await writer.drain()
+        async with asyncio.timeout(OPTIONS.timeout):
+            for job in bugs_jobs.get(link.name, ()):
+                await link.send(job)
+                logging.info("Sent to [%s] bugs %s for %s", link.name, job.bugs, ','.join(job.arches or '*'))
+            if matches_options(OPTIONS.scan):
+                await link.send(messages.DoScan())
+                logging.info("Initiated scan for [%s]", link.name)
+
+            if matches_options(OPTIONS.info):
+                logging.info("Requesting status for [%s]", link.name)
+                data = await link.request(messages.GetStatus())
+                if isinstance(data, messages.ManagerStatus):
+                    statuses[link.name] = data
+
+            if matches_options(OPTIONS.metrics):
+                data = await link.request(messages.GetMetrics())
+                if isinstance(data, messages.MetricsResponse):
+                    manager_metrics[link.name] = data.text
+
+            if OPTIONS.action == 'fetch':
+                now = datetime.now(tz=UTC)
+                data = await link.request(messages.CompletedJobsRequest(since=fetch_datetimes.get(link.name, datetime.fromtimestamp(0))))
+                if isinstance(data, messages.CompletedJobsResponse):
+                    for bug_no, arch in data.passes:
+                        logging.info("test pass %d,%s", bug_no, arch)
+                    fetch_bugs_passed.extend(data.passes)
+                    fetch_datetimes[link.name] = now
+
+        if matches_options(OPTIONS.profile):
+            logging.info("Profiling [%s] for %.0fs", link.name, OPTIONS.profile_seconds)
+            async with asyncio.timeout(OPTIONS.timeout + OPTIONS.profile_seconds):
+                data = await link.request(messages.ProfileRequest(
+                    seconds=OPTIONS.profile_seconds, mode=OPTIONS.profile_mode, tester=OPTIONS.profile_tester or ''))
+            if isinstance(data, messages.ProfileResult):
+                manager_profiles[link.name] = data.text
+    except TimeoutError:
+        logging.error("Timeout while communicating with [%s]", link.name)
+    except Exception as exc:
+        logging.error("Failed communicating with socket [%s]", link.name, exc_info=exc)
+    finally:
+        await link.close()
+
 
-        if matches_options(OPTIONS.info):
-            writer.write(messages.dump(messages.GetStatus()))
-            logging.info("Requesting status for [%s]", socket_file.name)
-            await writer.drain()
-            data = messages.load(await reader.readuntil(b'\n'))
-            if isinstance(data, messages.ManagerStatus):
-                statuses[socket_file.name] = data
-
-        if OPTIONS.action == 'fetch':
-            now = datetime.now(tz=UTC)
-            writer.write(messages.dump(messages.CompletedJobsRequest(since=fetch_datetimes.get(socket_file.name, datetime.fromtimestamp(0)))))
-            await writer.drain()
-            data = messages.load(await reader.readuntil(b'\n'))
-            if isinstance(data, messages.CompletedJobsResponse):
-                for bug_no, arch in data.passes:
-                    logging.info("test pass %d,%s", bug_no, arch)
-                fetch_bugs_passed.extend(data.passes)
-                fetch_datetimes[socket_file.name] = now
+async def request_status(link: ManagerLink) -> messages.ManagerStatus | None:
+    try:
+        async with asyncio.timeout(OPTIONS.timeout):
+            await link.open()
+            return await link.request(messages.GetStatus())
     except Exception as exc:
-        logging.error("Failed communicating with socket [%s]", socket_file.name, exc_info=exc)
+        logging.error("Failed requesting status from [%s]", link.name, exc_info=exc)
+        return None
     finally:
-        with contextlib.suppress(Exception):
-            writer.close()
-            await writer.wait_closed()
+        await link.close()
+
+
+def shard_bugs(bugs: list[int], managers: dict[str, messages.ManagerStatus],
+               redundancy: dict[str, int]) -> dict[str, list[messages.GlobalJob]]:
+    """Assign every (bug, arch) pair to the managers with the most free capacity for the arch.
+
+    Free capacity of a manager for an arch is the amount of job slots of its testers for that
+    arch minus their queued and running bugs, lowered by the manager's relative load. Every
+    pair is assigned to one manager, or to ``redundancy[arch]`` managers.
+    """
+    free: dict[str, dict[str, float]] = {}
+    for host, status in managers.items():
+        load = status.load[0] / (status.cpu_count or 1)
+        for tester, tester_status in status.testers.items():
+            arch_free = free.setdefault(tester.arch, {})
+            slots = tester_status.slots_allowed or tester_status.jobs
+            arch_free[host] = arch_free.get(host, -load) + slots - len(tester_status.bugs_queue)
+
+    assigned: dict[str, dict[int, set[str]]] = {}
+    for bug_no in bugs:
+        for arch, hosts in free.items():
+            for host in sorted(hosts, key=hosts.__getitem__, reverse=True)[:redundancy.get(arch, 1)]:
+                assigned.setdefault(host, {}).setdefault(bug_no, set()).add(arch)
+                hosts[host] -= 1
+
+    jobs: dict[str, list[messages.GlobalJob]] = {}
+    for host, host_bugs in assigned.items():
+        by_arches: dict[frozenset[str], list[int]] = {}
+        for bug_no, arches in host_bugs.items():
+            by_arches.setdefault(frozenset(arches), []).append(bug_no)
+        jobs[host] = [
+            messages.GlobalJob(bugs=arch_bugs, priority=OPTIONS.priority, arches=arches)
+            for arches, arch_bugs in by_arches.items()
+        ]
+    return jobs
+
+
+class ControllerDaemon:
+    """Long running controller, keeping SSH masters and manager connections open."""
+
+    def __init__(self, interval: int, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.links: dict[str, ManagerLink] = {}
+        self.statuses: dict[str, messages.ManagerStatus] = {}
+        self.watchers: set[asyncio.Queue] = set()
+        self.started = datetime.now(tz=UTC)
+
+    def discover_hosts(self) -> set[str]:
+        hosts = {socket_file.name for socket_file in comm_dir.iterdir()}
+        with contextlib.suppress(FileNotFoundError):
+            hosts.update(collect_ssh_hosts())
+        return hosts.union(collect_tcp_managers())
+
+    async def supervise(self, host: str):
+        link = self.links[host]
+        since = self.started
+        delay = 1
+        while True:
+            if not link.connected:
+                try:
+                    with contextlib.suppress(FileNotFoundError):
+                        if host in collect_ssh_hosts() and (
+                                not link.socket_file.exists() or not await run_ssh('-O', 'check', host)):
+                            # the SSH master is gone, so restart it
+                            await connect(host)
+                    async with asyncio.timeout(self.timeout):
+                        await link.open()
+                    logging.info("[%s] connected", host)
+                    delay = 1
+                except Exception as exc:
+                    logging.warning("[%s] connection failed (%s), retrying in %ds", host, exc, delay)
+                    self.statuses.pop(host, None)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 300)
+                    continue
+
+            try:
+                async with asyncio.timeout(self.timeout):
+                    now = datetime.now(tz=UTC)
+                    status = await link.request(messages.GetStatus())
+                    completed = await link.request(messages.CompletedJobsRequest(since=since))
+                self.statuses[host] = status
+                since = now
+                self.notify(messages.ControllerWatchEvent(host=host, status=status, completed=completed))
+            except Exception as exc:
+                logging.warning("[%s] polling failed (%s), reconnecting", host, exc)
+                await link.close()
+                continue
+            await asyncio.sleep(self.interval)
+
+    def notify(self, event: messages.ControllerWatchEvent):
+        for queue in self.watchers:
+            queue.put_nowait(event)
+
+    async def forward(self, job: messages.ControllerForward) -> messages.ControllerForwardResult:
+        if not (link := self.links.get(job.host)) or not link.connected:
+            return messages.ControllerForwardResult(error='not connected')
+        if isinstance(job.request, messages.GetStatus) and (status := self.statuses.get(job.host)):
+            return messages.ControllerForwardResult(result=status)
+        try:
+            timeout = self.timeout
+            if isinstance(job.request, messages.ProfileRequest):
+                timeout += job.request.seconds
+            async with asyncio.timeout(timeout):
+                if job.reply:
+                    return messages.ControllerForwardResult(result=await link.request(job.request))
+                await link.send(job.request)
+                return messages.ControllerForwardResult()
+        except Exception as exc:
+            return messages.ControllerForwardResult(error=repr(exc))
+
+    async def handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def write(obj):
+            writer.write(messages.dump(obj))
+            return writer.drain()
+
+        try:
+            while data := await reader.readuntil(b'\n'):
+                data = messages.load(data)
+                if isinstance(data, messages.ControllerHosts):
+                    await write(tuple(host for host, link in self.links.items() if link.connected))
+                elif isinstance(data, messages.ControllerForward):
+                    await write(await self.forward(data))
+                elif isinstance(data, messages.ControllerWatch):
+                    self.watchers.add(queue := asyncio.Queue())
+                    try:
+                        for host, status in self.statuses.items():
+                            await write(messages.ControllerWatchEvent(host=host, status=status, completed=None))
+                        while True:
+                            await write(await queue.get())
+                    finally:
+                        self.watchers.discard(queue)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            with contextlib.suppress(Exception):
+                writer.close()
+                await writer.wait_closed()
+
+    async def run(self):
+        comm_dir.mkdir(parents=True, exist_ok=True)
+        if daemon_socket.exists():
+            daemon_socket.unlink()
+        server = await asyncio.start_unix_server(self.handler, path=daemon_socket)
+        os.chmod(daemon_socket, 0o600)
+        logging.info("Controller daemon listening on %s", daemon_socket)
+        try:
+            while True:
+                tcp_managers = collect_tcp_managers()
+                for host in self.discover_hosts().difference(self.links):
+                    if address := tcp_managers.get(host):
+                        self.links[host] = TcpLink(host, address)
+                    else:
+                        self.links[host] = ManagerLink(host, comm_dir / host)
+                    asyncio.ensure_future(self.supervise(host))
+                await asyncio.sleep(self.interval)
+        finally:
+            server.close()
+            daemon_socket.unlink(missing_ok=True)
+
+
+async def watch():
+    if not daemon_socket.exists():
+        logging.error("watch needs a running controller daemon (`%s daemon`)", Path(__file__).name)
+        return
+    reader, writer = await asyncio.open_unix_connection(path=daemon_socket)
+    writer.write(messages.dump(messages.ControllerWatch()))
+    await writer.drain()
+    with contextlib.suppress(asyncio.IncompleteReadError):
+        while data := await reader.readuntil(b'\n'):
+            event: messages.ControllerWatchEvent = messages.load(data)
+            if event.status:
+                queued = sum(len(tester.bugs_queue) for tester in event.status.testers.values())
+                print(f'{datetime.now():%H:%M:%S} [{event.host}] load {event.status.load[0]:.2f}, '
+                      f'{len(event.status.testers)} testers, {queued} queued')
+            if event.completed:
+                for bug_no, arch in event.completed.passes:
+                    print(f'{datetime.now():%H:%M:%S} [{event.host}] pass {bug_no},{arch}')
+                for bug_no, arch in event.completed.failed:
+                    print(f'{datetime.now():%H:%M:%S} [{event.host}] fail {bug_no},{arch}')
+
+
+def redundancy_arg(value: str) -> tuple[str, int]:
+    arch, count = value.split('=', maxsplit=1)
+    return arch, int(count)
 
 
 def argv_parser() -> ArgumentParser:
@@ -222,10 +654,24 @@ def argv_parser() -> ArgumentParser:
                         help="Run scan for bugs on remote managers (optional comma delimited host list)")
     parser.add_argument("-i", "--info", action="store", const='*', nargs='?',
                         help="Show info about the connected managers and testers")
+    parser.add_argument("-m", "--metrics", action="store", const='*', nargs='?',
+                        help="Show metrics of the connected managers and testers")
+    parser.add_argument("-P", "--profile", action="store", const='*', nargs='?',
+                        help="Profile the remote managers (or a tester of them) and show the collapsed stacks")
+    parser.add_argument("--profile-seconds", type=float, default=10,
+                        help="Duration of the profile in seconds")
+    parser.add_argument("--profile-mode", choices=('sample', 'cprofile'), default='sample',
+                        help="Sample stacks of all threads, or cProfile the event loop's thread")
+    parser.add_argument("--profile-tester", action="store",
+                        help="Name of the tester to profile, instead of the manager")
     parser.add_argument("-b", "--bugs", nargs='*', type=int,
                         help="Bugs to test")
     parser.add_argument("-p", "--priority", type=int, default=0,
                         help="Priority for specified bugs")
+    parser.add_argument("-r", "--redundancy", action="append", type=redundancy_arg, default=[],
+                        metavar="ARCH=N", help="Amount of managers to test each bug on ARCH (default 1)")
+    parser.add_argument("-t", "--timeout", type=float, default=8,
+                        help="Timeout in seconds for communicating with each manager")
 
     subparsers = parser.add_subparsers(title='actions', dest='action')
 
@@ -238,24 +684,48 @@ def argv_parser() -> ArgumentParser:
                               help="Apply and commit all passing bugs on repo")
     fetch_parser.add_argument("-r", "--resolve", dest="fetch_resolve", action="store_true",
                               help="Resolve all passing bugs on repo")
+    fetch_parser.add_argument("-j", "--jobs", dest="fetch_jobs", type=int, default=4,
+                              help="Amount of simultaneous bugzilla requests while applying")
+
+    daemon_parser = subparsers.add_parser('daemon', help="Keep connections to all managers open")
+    daemon_parser.add_argument("--interval", dest="daemon_interval", type=int, default=60,
+                               help="Seconds between status polls of every manager")
+
+    subparsers.add_parser('watch', help="Stream status and completed results from the daemon")
     return parser
 
 
 OPTIONS: Any = None
+daemon_socket = base_dir / 'controller.socket'
 fetch_datetimes = read_fetch_datetimes()
 fetch_bugs_passed: list[tuple[int, str]] = []
 statuses: dict[str, messages.ManagerStatus] = {}
+bugs_jobs: dict[str, list[messages.GlobalJob]] = {}
+manager_metrics: dict[str, str] = {}
+manager_profiles: dict[str, str] = {}
 
 
 async def main():
     if OPTIONS.connect:
         await connect(OPTIONS.connect)
 
-    try:
-        async with asyncio.timeout(8):
-            await asyncio.gather(*map(manager_communicate, comm_dir.iterdir()))
-    except asyncio.TimeoutError:
-        logging.error("Timeout while communicating with managers")
+    if OPTIONS.action == 'daemon':
+        await ControllerDaemon(OPTIONS.daemon_interval, OPTIONS.timeout).run()
+        return
+    if OPTIONS.action == 'watch':
+        await watch()
+        return
+
+    links = await open_links()
+    if OPTIONS.bugs:
+        managers = dict(zip((link.name for link in links), await asyncio.gather(*map(request_status, links))))
+        if managers := {host: status for host, status in managers.items() if status}:
+            bugs_jobs.update(shard_bugs(OPTIONS.bugs, managers, dict(OPTIONS.redundancy)))
+        else:
+            logging.warning("No manager status available, sending all bugs to every manager")
+            job = messages.GlobalJob(priority=OPTIONS.priority, bugs=OPTIONS.bugs)
+            bugs_jobs.update((link.name, [job]) for link in links)
+    await asyncio.gather(*map(manager_communicate, links))
 
     if OPTIONS.action == 'fetch' and not OPTIONS.fetch_dryrun and HAVE_NATTKA:
         if fetch_bugs_passed and OPTIONS.fetch_apply and OPTIONS.fetch_repo:
@@ -276,6 +746,13 @@ async def main():
             for tester, tester_status in status.testers.items():
                 print(f'+-- "{tester.name}" of arch {tester.arch}:')
                 print('|   |')
+                if tester_status.slots_allowed:
+                    pressure = f' - {tester_status.admission}' if tester_status.admission else ''
+                    print(f'|   +-- Slots: {tester_status.slots_allowed}/{tester_status.jobs}{pressure}')
+                if ccache := tester_status.ccache:
+                    hit_rate = 100 * ccache.hits / total if (total := ccache.hits + ccache.misses) else 0
+                    print(f'|   +-- ccache: {hit_rate:.1f}% hits ({ccache.hits}/{total}), '
+                          f'{ccache.size / 2**30:.2f}/{ccache.max_size / 2**30:.2f} GiB')
                 print(f'|   +-- Queue (size {len(tester_status.bugs_queue)})')
                 if tester_status.bugs_queue:
                     print(f'|   |   {", ".join(map(str, tester_status.bugs_queue[:7]))}')
@@ -285,6 +762,15 @@ async def main():
                     for job in tester_status.merging_atoms:
                         print(f'|       +-- {job}')
 
+    for host, text in manager_metrics.items():
+        print(f'# {host}')
+        print(text)
+
+    for host, text in manager_profiles.items():
+        print(f'# {host}')
+        print(text)
+
+
 if __name__ == '__main__':
     OPTIONS = argv_parser().parse_args()
     asyncio.run(main())
@@ -5,6 +5,9 @@ from pathlib import Path
 from typing import FrozenSet
 
 import messages
+from metrics import Histogram
+
+DB_WRITE = Histogram('tattoo_db_write_seconds', 'Time spent writing test results into the DB')
 
 
 class DB:
@@ -29,7 +32,7 @@ class DB:
         insert_query = """
             REPLACE INTO tests (arch, machine_name, bug_no, state) VALUES (?, ?, ?, ?);
         """
-        with self.conn:
+        with DB_WRITE.time(), self.conn:
             self.conn.execute(insert_query, (worker.canonical_arch(), worker.name, job.bug_number, int(job.success)))
 
     def get_reportes(self, since: datetime) -> messages.CompletedJobsResponse:
@@ -51,3 +54,10 @@ class DB:
         with self.conn:
             done = {row[0] for row in self.conn.execute(select_query, [arch])}
             return bugs - done
+
+    def filter_passed(self, arch: str, bugs: FrozenSet[int]) -> FrozenSet[int]:
+        select_query = f"""
+            SELECT bug_no FROM tests WHERE bug_no in ({','.join(map(str, bugs))}) AND arch = ? AND state = 1;
+        """
+        with self.conn:
+            return frozenset(row[0] for row in self.conn.execute(select_query, [arch]))
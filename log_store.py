@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(value: str) -> int:
+    """Parse a size like ``500M`` or ``10G`` into bytes."""
+    value = value.strip().upper().removesuffix('B')
+    if value and value[-1] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def open_compressed(path: Path) -> tuple[BinaryIO, Path]:
+    """Open a compressed log for writing, with zstd if available, otherwise gzip.
+
+    Returns the file and its path, with the compression suffix added.
+    """
+    if HAS_ZSTD:
+        path = path.with_name(path.name + '.zst')
+        return zstandard.open(path, 'wb'), path
+    path = path.with_name(path.name + '.gz')
+    return gzip.open(path, 'wb', compresslevel=6), path
+
+
+class LogStore:
+    """Index of which logs belong to which bug, with size bounded retention.
+
+    The index is a JSON file mapping bug numbers to their log files, inside
+    the logs directory. When the total size of the logs directory is above
+    the budget, the oldest files are removed first.
+    """
+
+    def __init__(self, logs_dir: Path, budget: int | None):
+        self.logs_dir = logs_dir
+        self.budget = budget
+        self.index_file = logs_dir / 'index.json'
+        # total size of the logs directory, unknown until the first scan
+        self.total: int | None = None
+        self.enforcing = False
+        try:
+            self.index: dict[str, list[str]] = json.loads(self.index_file.read_text())
+        except (OSError, ValueError):
+            self.index = {}
+
+    def add(self, bug_no: int, files: Iterable[Path | str]):
+        if files := [str(file) for file in files if os.path.exists(file)]:
+            self.index.setdefault(str(bug_no), []).extend(files)
+            self.save()
+            if self.total is not None:
+                for file in files:
+                    with contextlib.suppress(OSError):
+                        self.total += os.stat(file).st_size
+
+    def logs(self, bug_no: int) -> list[str]:
+        return self.index.get(str(bug_no), [])
+
+    def remove_oldest(self) -> tuple[set[str], int]:
+        """Remove the oldest files until the logs directory fits the budget.
+
+        Returns the removed files and the remaining total size. Touches only
+        the filesystem, so it can run in a thread.
+        """
+        files = []
+        for file in self.logs_dir.rglob('*'):
+            # keep tattoo's own state files, like this index
+            if not file.is_file() or (file.parent == self.logs_dir and file.suffix in ('.json', '.jsonl', '.tmp')):
+                continue
+            with contextlib.suppress(OSError):
+                stat = file.stat()
+                files.append((stat.st_mtime, stat.st_size, file))
+        total = sum(size for _, size, _ in files)
+        removed = set()
+        for _, size, file in sorted(files):
+            if total <= self.budget:
+                break
+            try:
+                file.unlink()
+            except OSError as exc:
+                logging.error('failed to remove old log %s', file, exc_info=exc)
+                continue
+            total -= size
+            removed.add(str(file))
+        return removed, total
+
+    async def enforce_budget(self):
+        """Remove the oldest logs when over budget.
+
+        The total size is kept up to date by ``add``, so the logs directory
+        is scanned (in a thread) only at start and when over budget.
+        """
+        if self.budget is None or self.enforcing or (self.total is not None and self.total <= self.budget):
+            return
+        self.enforcing = True
+        try:
+            removed, self.total = await asyncio.to_thread(self.remove_oldest)
+        finally:
+            self.enforcing = False
+        if removed:
+            logging.info('removed %d old logs to stay within logs budget', len(removed))
+            self.index = {
+                bug: remaining
+                for bug, files in self.index.items()
+                if (remaining := [file for file in files if file not in removed])
+            }
+            self.save()
+
+    def save(self):
+        try:
+            tmp_file = self.index_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps(self.index))
+            tmp_file.replace(self.index_file)
+        except OSError as exc:
+            logging.error('saving logs index failed', exc_info=exc)
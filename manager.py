@@ -1,30 +1,120 @@
 #!/usr/bin/env python
 
 import asyncio
+import itertools
 import logging
 import os
 
 import bugs_fetcher
 import messages
+import metrics
+import profiler
+from admission import host_pressure
+from blockers_graph import BlockersGraph, ReleasedBug
 from db import DB
+from rate_limit import backoff_delay, bugzilla_bucket
 from sdnotify import sdnotify, set_logging_format, socket_activated_server
+from transport import tcp_server
 
 workers: dict[messages.Worker, asyncio.StreamWriter] = {}
 workers_status: dict[messages.Worker, asyncio.Future] = {}
+workers_metrics: dict[messages.Worker, tuple[metrics.MetricFamily, ...]] = {}
+workers_profiles: dict[messages.Worker, asyncio.Future] = {}
+# one status request at a time, as testers' replies aren't matched to requests
+status_lock = asyncio.Lock()
+
+TESTERS_CONNECTED = metrics.Gauge('tattoo_testers_connected', 'Amount of testers connected to the manager')
+BLOCKED_BUGS = metrics.Gauge('tattoo_blocked_bugs', 'Amount of (bug, arch) pairs waiting for their blockers')
+MESSAGES_RECEIVED = metrics.Counter('tattoo_manager_messages_total', 'Messages received by the manager, by type')
+DISPATCH_DURATION = metrics.Histogram('tattoo_dispatch_seconds', 'Time from receiving bugs to sending them to a tester')
 
 db = DB()
+blockers = BlockersGraph()
+
+async def collect_bugs(bugs: list[int] | tuple[()], *targets: messages.Worker) -> list[tuple[messages.Worker, list[int]]]:
+    attempt = 0
+    while True:
+        await bugzilla_bucket.acquire(2)
+        blocked: dict[messages.Worker, dict[int, frozenset[int]]] = {}
+        try:
+            result = list(bugs_fetcher.collect_bugs(bugs, *targets, blocked=blocked))
+        except Exception as exc:
+            if attempt >= 4:
+                raise
+            delay = backoff_delay(attempt, base=30)
+            logging.warning('collecting bugs failed, retrying in %.0fs', delay, exc_info=exc)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        for worker, worker_blocked in blocked.items():
+            await track_blocked(worker, worker_blocked)
+        return result
+
+async def grant_bugzilla_tokens(writer: asyncio.StreamWriter, request: messages.BugzillaTokenRequest):
+    await bugzilla_bucket.acquire(request.count)
+    if not writer.is_closing():
+        writer.write(messages.dump(messages.BugzillaTokenGrant()))
+        await writer.drain()
+
+async def track_blocked(worker: messages.Worker, blocked: dict[int, frozenset[int]]):
+    passed = db.filter_passed(worker.canonical_arch(), frozenset().union(*blocked.values()))
+    released: list[ReleasedBug] = []
+    for bug_no, bug_blockers in blocked.items():
+        released += blockers.add(bug_no, worker.arch, bug_blockers)
+    for blocker in passed:
+        released += blockers.blocker_done(blocker, worker.arch)
+    await dispatch_released(worker.arch, released)
+
+async def dispatch_released(arch: str, released: list[ReleasedBug]):
+    """Send bugs whose blockers are done to the testers of the arch."""
+    not_tested = db.filter_not_tested(arch.removeprefix('~'), frozenset(item.bug for item in released))
+    if not (released := [item for item in released if item.bug in not_tested]):
+        return
+    released.sort(key=lambda item: item.priority)
+    for priority, group in itertools.groupby(released, key=lambda item: item.priority):
+        group = list(group)
+        job = messages.GlobalJob(
+            bugs=[item.bug for item in group],
+            priority=priority,
+            released_blockers=frozenset().union(*(item.blockers for item in group)),
+        )
+        for worker, writer in tuple(workers.items()):
+            if worker.arch == arch:
+                logging.info('released to %s bugs %s', worker.name, job.bugs)
+                writer.write(messages.dump(job))
+                await writer.drain()
+
+async def refresh_blockers():
+    while True:
+        await asyncio.sleep(1800) # 30m = 30 * 60s
+        if not (waiting := blockers.waiting_blockers()):
+            blockers.refresh({})
+            continue
+        try:
+            await bugzilla_bucket.acquire()
+            blockers_arches = bugs_fetcher.blockers_arches(waiting)
+        except Exception as exc:
+            logging.error('refreshing blockers failed', exc_info=exc)
+            continue
+        for arch, released in blockers.refresh(blockers_arches).items():
+            await dispatch_released(arch, released)
 
 async def process_bugs(job: messages.GlobalJob):
     logging.info('processing bugs %s', job.bugs)
-    for worker, bugs in bugs_fetcher.collect_bugs(job.bugs, *workers.keys()):
+    started = asyncio.get_running_loop().time()
+    if not (targets := [worker for worker in workers if job.arches is None or worker.arch in job.arches]):
+        logging.info('no testers for arches %s', ','.join(job.arches or ()))
+        return
+    for worker, bugs in await collect_bugs(job.bugs, *targets):
         logging.info('sent to %s bugs %s', worker.name, bugs)
         workers[worker].write(messages.dump(messages.GlobalJob(priority=job.priority, bugs=bugs)))
         await workers[worker].drain()
+        DISPATCH_DURATION.observe(asyncio.get_running_loop().time() - started)
     logging.info('finished processing bugs')
 
 async def do_scan(trigger: str):
     logging.info('started %s scan for new bugs', trigger)
-    for worker, bugs in bugs_fetcher.collect_bugs((), *workers.keys()):
+    for worker, bugs in await collect_bugs((), *workers.keys()):
         if bugs := list(db.filter_not_tested(worker.canonical_arch(), frozenset(bugs))):
             logging.info('sent to %s bugs %s', worker.name, bugs)
             workers[worker].write(messages.dump(messages.GlobalJob(priority=100, bugs=bugs)))
@@ -41,22 +131,76 @@ async def periodic_keepalive(writer: asyncio.StreamWriter):
         pass
 
 async def get_status():
-    if workers:
-        for worker in workers:
-            workers_status[worker] = asyncio.get_running_loop().create_future()
-        for worker, writer in workers.items():
-            writer.write(messages.dump(messages.GetStatus()))
-            await writer.drain()
-        worker_names, statuses = tuple(zip(*workers_status.items()))
-        statuses = dict(zip(worker_names, await asyncio.gather(*statuses)))
-    else:
-        statuses = {}
+    async with status_lock:
+        futures = {}
+        for worker, writer in list(workers.items()):
+            futures[worker] = workers_status[worker] = asyncio.get_running_loop().create_future()
+            try:
+                writer.write(messages.dump(messages.GetStatus()))
+                await writer.drain()
+            except ConnectionError:
+                workers_status.pop(worker).set_result(None)
+        statuses = {
+            worker: status
+            for worker, status in zip(futures, await asyncio.gather(*futures.values()))
+            if status is not None
+        }
     return messages.ManagerStatus(
         load=os.getloadavg(),
         cpu_count=os.cpu_count(),
         testers=statuses,
     )
 
+async def get_profile(request: messages.ProfileRequest) -> messages.ProfileResult:
+    if not request.tester:
+        return messages.ProfileResult(text=await profiler.profile(request.seconds, request.mode))
+    for worker, writer in workers.items():
+        if worker.name == request.tester:
+            if worker in workers_profiles:
+                return messages.ProfileResult(text=f'a profile of {worker.name} is already running\n')
+            workers_profiles[worker] = asyncio.get_running_loop().create_future()
+            try:
+                writer.write(messages.dump(request))
+                await writer.drain()
+                # leave the tester some time to collect and send the result
+                return await asyncio.wait_for(workers_profiles[worker], request.seconds + 30)
+            except TimeoutError:
+                return messages.ProfileResult(text=f'profile of {worker.name} timed out\n')
+            except ConnectionError as exc:
+                return messages.ProfileResult(text=f'profile of {worker.name} failed: {exc}\n')
+            finally:
+                workers_profiles.pop(worker, None)
+    return messages.ProfileResult(text=f'no tester named {request.tester}\n')
+
+def collect_metrics() -> tuple[metrics.MetricFamily, ...]:
+    TESTERS_CONNECTED.set(len(workers))
+    BLOCKED_BUGS.set(len(blockers))
+    return metrics.collect() + tuple(itertools.chain.from_iterable(
+        metrics.with_labels(families, tester=worker.name, arch=worker.arch)
+        for worker, families in workers_metrics.items()
+    ))
+
+async def answer(request):
+    if isinstance(request, messages.GetStatus):
+        return await get_status()
+    if isinstance(request, messages.GetMetrics):
+        return messages.MetricsResponse(text=metrics.render(collect_metrics()))
+    if isinstance(request, messages.CompletedJobsRequest):
+        return db.get_reportes(request.since)
+    if isinstance(request, messages.ProfileRequest):
+        return await get_profile(request)
+    return None
+
+async def answer_request(writer: asyncio.StreamWriter, request: messages.Request):
+    try:
+        result = await answer(request.request)
+    except Exception as exc:
+        logging.error('answering %r failed', request.request, exc_info=exc)
+        result = None
+    if not writer.is_closing():
+        writer.write(messages.dump(messages.Reply(id=request.id, result=result)))
+        await writer.drain()
+
 async def auto_scan():
     while True:
         await asyncio.sleep(14400) # 4h = 4 * 60 * 60s
@@ -68,9 +212,9 @@ async def auto_scan():
         if any(t.bugs_queue for t in status.testers.values()):
             logging.warning("Self scan skipped because tester's queues aren't empty")
             continue
-        while (load := 100 * os.getloadavg()[0] / (os.cpu_count() or 1)) > 50:
-            logging.warning("Self scan postponed because of high load (%.2f%%)", load)
-            await asyncio.sleep(1200) # 20m = 20 * 60s
+        while reason := host_pressure(max_load=0.5):
+            logging.warning("Self scan postponed because of %s", reason)
+            await asyncio.sleep(300) # 5m = 5 * 60s
 
         await do_scan("self")
 
@@ -88,6 +232,7 @@ async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
                 data = exc.partial
             if data:
                 data = messages.load(data)
+                MESSAGES_RECEIVED.inc(type=type(data).__name__)
                 if isinstance(data, messages.Worker):
                     if data.arch:
                         worker = data
@@ -99,16 +244,26 @@ async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
                 elif isinstance(data, messages.BugJobDone):
                     logging.debug('done %d,%s', data.bug_number, worker.canonical_arch())
                     db.report_job(worker, data)
-                elif isinstance(data, messages.CompletedJobsRequest):
-                    writer.write(messages.dump(db.get_reportes(data.since)))
-                    await writer.drain()
+                    blockers.discard(data.bug_number, worker.arch)
+                    if data.success:
+                        asyncio.ensure_future(dispatch_released(worker.arch, blockers.blocker_done(data.bug_number, worker.arch)))
+                elif isinstance(data, messages.BugzillaTokenRequest):
+                    asyncio.ensure_future(grant_bugzilla_tokens(writer, data))
                 elif isinstance(data, messages.DoScan):
                     asyncio.ensure_future(do_scan("manual"))
                 elif isinstance(data, messages.TesterStatus):
-                    workers_status.pop(worker).set_result(data)
-                elif isinstance(data, messages.GetStatus):
-                    writer.write(messages.dump(await get_status()))
+                    if future := workers_status.pop(worker, None):
+                        future.set_result(data)
+                elif isinstance(data, messages.MetricsReport):
+                    workers_metrics[worker] = data.families
+                elif isinstance(data, (messages.GetStatus, messages.GetMetrics, messages.CompletedJobsRequest, messages.ProfileRequest)):
+                    writer.write(messages.dump(await answer(data)))
                     await writer.drain()
+                elif isinstance(data, messages.Request):
+                    asyncio.ensure_future(answer_request(writer, data))
+                elif isinstance(data, messages.ProfileResult):
+                    if (future := workers_profiles.get(worker)) and not future.done():
+                        future.set_result(data)
 
         if worker.name:
             logging.info('[%s] normal connection closed', worker.name)
@@ -125,13 +280,29 @@ async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
     if worker.name:
         logging.warning('Tester [%s] was disconnected', worker.name)
     workers.pop(worker, None)
+    workers_metrics.pop(worker, None)
+    if future := workers_status.pop(worker, None):
+        # disconnected testers are left out of the status
+        future.set_result(None)
+    if (future := workers_profiles.get(worker)) and not future.done():
+        # not cancel(), which would raise in the handler of the requester
+        future.set_result(messages.ProfileResult(text=f'{worker.name} disconnected while profiling\n'))
 
 
 async def main():
     try:
         server = await socket_activated_server(handler, messages.SOCKET_FILENAME)
+        if listen := os.getenv('TATTOO_METRICS_LISTEN'):
+            await metrics.serve(listen, collect_metrics)
+            logging.info('Serving metrics on %s', listen)
+        if listen := os.getenv('TATTOO_LISTEN'):
+            await tcp_server(handler, listen)
+            logging.info('Listening for controllers on %s', listen)
         sdnotify('READY=1')
         asyncio.ensure_future(auto_scan())
+        asyncio.ensure_future(refresh_blockers())
+        asyncio.ensure_future(metrics.monitor_event_loop_lag())
+        asyncio.ensure_future(profiler.monitor_blocking())
         await server.serve_forever()
     except KeyboardInterrupt:
         logging.info('Caught a CTRL + C, good bye')
@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import Any, NamedTuple
 from datetime import datetime
 import pickle
 import base64
@@ -27,6 +27,16 @@ class BugJobDone(NamedTuple):
 class GlobalJob(NamedTuple):
     bugs: list[int]
     priority: int = 0
+    arches: frozenset[str] | None = None
+    released_blockers: frozenset[int] = frozenset()
+
+
+class BugzillaTokenRequest(NamedTuple):
+    count: int = 1
+
+
+class BugzillaTokenGrant:
+    pass
 
 
 class CompletedJobsRequest(NamedTuple):
@@ -47,9 +57,20 @@ class GetStatus:
     pass
 
 
+class CcacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
 class TesterStatus(NamedTuple):
     bugs_queue: tuple[int, ...]
     merging_atoms: tuple[str, ...]
+    jobs: int = 1
+    slots_allowed: int = 0
+    admission: str = ''
+    ccache: CcacheStats | None = None
 
 
 class ManagerStatus(NamedTuple):
@@ -58,6 +79,64 @@ class ManagerStatus(NamedTuple):
     testers: dict[Worker, TesterStatus]
 
 
+class GetMetrics:
+    pass
+
+
+class MetricsReport(NamedTuple):
+    families: tuple
+
+
+class MetricsResponse(NamedTuple):
+    text: str
+
+
+class ProfileRequest(NamedTuple):
+    seconds: float = 10
+    mode: str = 'sample'
+    tester: str = ''
+
+
+class ProfileResult(NamedTuple):
+    text: str
+
+
+class Request(NamedTuple):
+    """Request with a reply, which may be answered out of order on the same connection."""
+    id: int
+    request: Any
+
+
+class Reply(NamedTuple):
+    id: int
+    result: Any
+
+
+class ControllerHosts:
+    pass
+
+
+class ControllerForward(NamedTuple):
+    host: str
+    request: Any
+    reply: bool = True
+
+
+class ControllerForwardResult(NamedTuple):
+    result: Any = None
+    error: str | None = None
+
+
+class ControllerWatch:
+    pass
+
+
+class ControllerWatchEvent(NamedTuple):
+    host: str
+    status: ManagerStatus | None
+    completed: CompletedJobsResponse | None
+
+
 def dump(obj) -> bytes:
     return base64.b64encode(pickle.dumps(obj)) + b'\n'
 
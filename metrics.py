@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import time
+from bisect import bisect_left
+from typing import Iterable, Iterator, NamedTuple
+
+Labels = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 1800, 3600, 7200, 14400, 43200)
+
+
+class MetricFamily(NamedTuple):
+    name: str
+    kind: str
+    help: str
+    samples: tuple[tuple[str, Labels, float], ...]
+
+
+registry: dict[str, 'Counter | Gauge | Histogram'] = {}
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: dict[Labels, float] = {}
+        registry[name] = self
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self) -> MetricFamily:
+        return MetricFamily(self.name, self.kind, self.help, tuple(
+            (self.name, labels, value) for labels, value in self.values.items()
+        ))
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels: str):
+        self.values[_labels(labels)] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = {}
+        registry[name] = self
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def collect(self) -> MetricFamily:
+        samples: list[tuple[str, Labels, float]] = []
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip((*map(str, self.buckets), '+Inf'), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', labels + (('le', bound), ), cumulative))
+            samples.append((f'{self.name}_sum', labels, self.sums[labels]))
+            samples.append((f'{self.name}_count', labels, cumulative))
+        return MetricFamily(self.name, self.kind, self.help, tuple(samples))
+
+
+def collect() -> tuple[MetricFamily, ...]:
+    return tuple(metric.collect() for metric in registry.values())
+
+
+def with_labels(families: Iterable[MetricFamily], **labels: str) -> tuple[MetricFamily, ...]:
+    extra = _labels(labels)
+    return tuple(
+        family._replace(samples=tuple((name, extra + sample_labels, value) for name, sample_labels, value in family.samples))
+        for family in families
+    )
+
+
+def render(families: Iterable[MetricFamily]) -> str:
+    """Render metric families in the Prometheus text exposition format."""
+    merged: dict[str, MetricFamily] = {}
+    for family in families:
+        if existing := merged.get(family.name):
+            merged[family.name] = existing._replace(samples=existing.samples + family.samples)
+        else:
+            merged[family.name] = family
+    lines: list[str] = []
+    for family in merged.values():
+        lines.append(f'# HELP {family.name} {family.help}')
+        lines.append(f'# TYPE {family.name} {family.kind}')
+        for name, labels, value in family.samples:
+            if labels:
+                formatted = ','.join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f'{name}{{{formatted}}} {value:g}')
+            else:
+                lines.append(f'{name} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+async def serve(listen: str, families) -> asyncio.Server:
+    """Serve ``families()`` over plain HTTP on a unix socket path or ``host:port``."""
+    async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        with contextlib.suppress(Exception):
+            await reader.readuntil(b'\r\n\r\n')
+            body = render(families()).encode()
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n')
+            writer.write(f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+        writer.close()
+
+    if listen.startswith('/'):
+        return await asyncio.start_unix_server(handler, path=listen)
+    host, port = listen.rsplit(':', maxsplit=1)
+    return await asyncio.start_server(handler, host=host or None, port=int(port))
+
+
+EVENT_LOOP_LAG = Histogram('tattoo_event_loop_lag_seconds', 'Delay of the asyncio event loop in waking up a sleeping task')
+
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
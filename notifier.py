@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from rate_limit import TokenBucket
+
+IRKER_ADDRESS = ('127.0.0.1', 6659)
+
+
+class IrkerNotifier:
+    """Send bug results to IRC through irkerd, over a single persistent TCP connection.
+
+    Results are collected and sent every ``interval`` seconds: a few results
+    are sent one by one, more are coalesced into a digest. Messages are rate
+    limited, and spooled to a file while irkerd is unreachable, to be sent
+    once it is back.
+    """
+
+    IRC_CHANNEL = "#gentoo-tattoo"
+    DIGEST_THRESHOLD = 3
+    MAX_SPOOL = 1000
+
+    def __init__(self, identifier: str, spool_file: Path,
+                 interval: float = float(os.getenv('TATTOO_IRC_DIGEST_SECS', '60'))):
+        self.identifier = identifier
+        self.spool_file = spool_file
+        self.interval = interval
+        self.results: list[tuple[int, str]] = []
+        self.bucket = TokenBucket(rate=float(os.getenv('TATTOO_IRC_RATE', '0.2')), burst=5)
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    def add(self, bugno: int, msg: str):
+        self.results.append((bugno, msg))
+
+    def privmsg(self, text: str) -> str:
+        return f"\x0314[{self.identifier}]: \x0F{text}"
+
+    def format_results(self, results: list[tuple[int, str]]) -> list[str]:
+        if len(results) <= self.DIGEST_THRESHOLD:
+            return [self.privmsg(f"\x0307bug #{bugno}\x0F - {msg}") for bugno, msg in results]
+        failed = [bugno for bugno, msg in results if msg != 'success']
+        text = f"{len(results) - len(failed)} passed, {len(failed)} failed"
+        if failed:
+            text += ': ' + ', '.join(f'#{bugno}' for bugno in failed)
+        return [self.privmsg(text)]
+
+    def read_spool(self) -> list[str]:
+        try:
+            return self.spool_file.read_text().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def write_spool(self, lines: list[str]):
+        if lines:
+            self.spool_file.write_text(''.join(f'{line}\n' for line in lines[-self.MAX_SPOOL:]))
+        else:
+            self.spool_file.unlink(missing_ok=True)
+
+    async def send(self, lines: list[str]) -> int:
+        """Send the lines to irkerd, and return how many were sent."""
+        for sent, line in enumerate(lines):
+            await self.bucket.acquire()
+            try:
+                # irkerd never writes, so EOF means it closed the connection, like on restart
+                if self.writer is None or self.writer.is_closing() or self.reader.at_eof():
+                    if self.writer:
+                        self.writer.close()
+                    self.reader, self.writer = await asyncio.open_connection(*IRKER_ADDRESS)
+                self.writer.write(f'{line}\n'.encode('utf8'))
+                await self.writer.drain()
+            except OSError as exc:
+                logging.warning('send to irker failed: %s', exc)
+                self.writer = None
+                return sent
+        return len(lines)
+
+    def pending_lines(self) -> list[str]:
+        results, self.results = self.results, []
+        spigot = f"ircs://irc.libera.chat:6697/{self.IRC_CHANNEL}"
+        return self.read_spool() + [
+            json.dumps({"to": spigot, "privmsg": message})
+            for message in self.format_results(results)
+        ]
+
+    async def flush(self):
+        if lines := self.pending_lines():
+            self.write_spool(lines)
+            sent = await self.send(lines)
+            self.write_spool(lines[sent:])
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.flush()
+        finally:
+            # keep the unsent results for the next run
+            with contextlib.suppress(OSError):
+                self.write_spool(self.pending_lines())
+            if self.writer:
+                self.writer.close()
@@ -0,0 +1,53 @@
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Iterable
+
+ATOM_RE = re.compile(r"""^\s*TUSE=".*" tatt_test_pkg '(?P<atom>[^']+)'""")
+VERSION_RE = re.compile(r'-\d+(\.\d+)*[a-z]?(_(alpha|beta|pre|rc|p)\d*)*(-r\d+)?$')
+
+
+def atom_package(atom: str) -> str:
+    """Return the ``category/package`` of an atom like ``=dev-lang/python-3.12.1-r1``."""
+    return VERSION_RE.sub('', atom.lstrip('=<>~'))
+
+
+def script_atoms(script: Path) -> tuple[str, ...]:
+    """Return the atoms tested by a ``{bug}.sh`` script generated by ``pkgdev tatt``."""
+    try:
+        lines = script.read_text().splitlines()
+    except OSError:
+        return ()
+    return tuple(dict.fromkeys(match.group('atom') for line in lines if (match := ATOM_RE.match(line))))
+
+
+class PackageStats:
+    """Per package history of test runs, persisted as JSON in the logs directory."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self.stats: dict[str, dict[str, float]] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def get(self, package: str, key: str) -> float | None:
+        return self.stats.get(package, {}).get(key)
+
+    def record(self, package: str, key: str, value: float, weight: float = 0.5):
+        """Record a new sample, as an exponential moving average over the previous ones."""
+        values = self.stats.setdefault(package, {})
+        previous = values.get(key)
+        values[key] = value if previous is None else weight * value + (1 - weight) * previous
+
+    def maximum(self, atoms: Iterable[str], key: str) -> float | None:
+        return max((value for atom in atoms if (value := self.get(atom_package(atom), key)) is not None), default=None)
+
+    def save(self):
+        try:
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.stats))
+            tmp_path.replace(self.path)
+        except OSError as exc:
+            logging.error('saving package stats failed', exc_info=exc)
@@ -35,18 +35,23 @@ tatt_pkg_error() {
     local eout=${2}
 
     local CP=${1#=}
-    local PORTAGE_TMPDIR=$( pinspect portageq envvar2 / PORTAGE_TMPDIR )
+    local PORTAGE_TMPDIR=${TATTOO_PORTAGE_TMPDIR:-$( pinspect portageq envvar2 / PORTAGE_TMPDIR )}
     local BUILDDIR=${PORTAGE_TMPDIR:-/var/tmp}/portage/${CP}
     local BUILDLOG=${BUILDDIR}/temp/build.log
     if [[ -s ${BUILDLOG} ]]; then
         mkdir -p {{ log_dir }}
         local LOGNAME=$( mktemp -p {{ log_dir }} "${CP/\//_}_use_XXXXX" )
-        cp "${BUILDLOG}" "${LOGNAME}"
-        echo "log_file: ${LOGNAME}" >> "{{ report_file }}"
+        local COMPRESS=gzip EXT=gz
+        if command -v zstd >/dev/null; then
+            COMPRESS=zstd EXT=zst
+        fi
+        ${COMPRESS} -c "${BUILDLOG}" > "${LOGNAME}.${EXT}"
+        rm -f "${LOGNAME}"
+        echo "log_file: ${LOGNAME}.${EXT}" >> "{{ report_file }}"
         readarray -d '' TESTLOGS < <(find "${BUILDDIR}/work" -iname '*test*log*' -print0)
         if [[ {{ "${#TESTLOGS[@]}" }} -gt 0 ]]; then
-            tar cf "${LOGNAME}.tar" "${TESTLOGS[@]}"
-            echo "extra_logs: ${LOGNAME}.tar" >> "{{ report_file }}"
+            tar -caf "${LOGNAME}.tar.${EXT}" "${TESTLOGS[@]}"
+            echo "extra_logs: ${LOGNAME}.tar.${EXT}" >> "{{ report_file }}"
         fi
     fi
 
@@ -106,6 +111,9 @@ tatt_test_pkg() {
     {% for env in extra_env_files %}
     printf "%s {{env}}\n" "${1}" >> "/etc/portage/package.env/pkgdev_tatt_{{ job_name }}/${CP}"
     {% endfor %}
+    if [[ -n ${TATTOO_TMPDIR_ENV} ]]; then
+        printf "%s %s\n" "${1}" "${TATTOO_TMPDIR_ENV}" >> "/etc/portage/package.env/pkgdev_tatt_{{ job_name }}/${CP}"
+    fi
 
     printf "%s %s\n" "${1}" "${TUSE}" > "/etc/portage/package.use/pkgdev_tatt_{{ job_name }}/${CP}"
 
@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+SLOW_CALLBACK_SECS = float(os.getenv('TATTOO_SLOW_CALLBACK_SECS', '1.0'))
+
+profile_lock = asyncio.Lock()
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """Sample the stacks of all other threads, and return them collapsed (``a;b;c count`` lines)."""
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    samples: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            samples[';'.join([names.get(ident, str(ident))] + stack[::-1])] += 1
+        time.sleep(interval)
+    return ''.join(f'{stack} {count}\n' for stack, count in samples.most_common())
+
+
+async def profile(seconds: float, mode: str = 'sample') -> str:
+    """Profile this process for ``seconds``, with a sampling profiler or ``cProfile``."""
+    if profile_lock.locked():
+        return 'a profile is already running\n'
+    async with profile_lock:
+        if mode == 'sample':
+            return await asyncio.to_thread(sample_stacks, seconds)
+        if mode == 'cprofile':
+            # profiles only the event loop's thread
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(60)
+            return output.getvalue()
+        return f'unknown profile mode {mode!r}\n'
+
+
+async def monitor_blocking(threshold: float = SLOW_CALLBACK_SECS):
+    """Log the stack of the event loop's thread, whenever it is blocked for longer than ``threshold``."""
+    loop_thread = threading.get_ident()
+    heartbeat = time.monotonic()
+    stop = threading.Event()
+
+    def watchdog():
+        reported = None
+        while not stop.wait(threshold / 4):
+            if (blocked := time.monotonic() - heartbeat) > threshold and reported != heartbeat:
+                reported = heartbeat
+                if frame := sys._current_frames().get(loop_thread):
+                    logging.warning('event loop blocked for more than %.2fs at:\n%s', blocked,
+                                    ''.join(traceback.format_stack(frame)))
+
+    thread = threading.Thread(target=watchdog, name='blocking-watchdog', daemon=True)
+    thread.start()
+    try:
+        while True:
+            heartbeat = time.monotonic()
+            await asyncio.sleep(threshold / 4)
+    finally:
+        stop.set()
+        with contextlib.suppress(RuntimeError):
+            thread.join(timeout=1)
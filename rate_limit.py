@@ -0,0 +1,48 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of requests to bugzilla.
+
+    Tokens are reserved in advance, so the bucket can go into debt, and the
+    caller sleeps until its reservation is covered. Safe to use from threads.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, count: float = 1) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, count: float = 1):
+        if delay := self.reserve(count):
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self, count: float = 1):
+        if delay := self.reserve(count):
+            time.sleep(delay)
+
+
+def backoff_delay(attempt: int, base: float = 60, cap: float = 3600) -> float:
+    """Exponential backoff with jitter, so retries from many testers don't align."""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+bugzilla_bucket = TokenBucket(
+    rate=float(os.getenv('BUGZILLA_RATE', '0.5')),
+    burst=float(os.getenv('BUGZILLA_BURST', '10')),
+)
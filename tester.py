@@ -2,7 +2,6 @@
 
 import asyncio
 import contextlib
-import json
 import logging
 import os
 import re
@@ -11,15 +10,25 @@ import socket
 import subprocess
 import warnings
 from argparse import ArgumentParser
+from collections import deque
+from datetime import datetime, UTC
 from pathlib import Path
 from random import shuffle
 from time import sleep
-from typing import Any, Callable, Iterator
+from typing import Any, BinaryIO, Callable, Iterator
 
 import bugs_fetcher
 import messages
+import metrics
+import profiler
+from admission import AdmissionController, job_cost
 from bugs_queue import BugsQueue, BugsQueueItem
+from ccache import Ccache
+from log_store import LogStore, open_compressed, parse_size
+from notifier import IrkerNotifier
+from package_stats import PackageStats, atom_package, script_atoms
 from sdnotify import sdnotify, set_logging_format
+from tmpdir import TmpdirPlacement, sample_build_size
 
 try:
     import psutil
@@ -28,33 +37,29 @@ except ImportError:
     warnings.warn('psutil not found - install "dev-python/psutil"')
     HAS_PSUTIL = False
 
-testing_dir = Path('/tmp/run')
+testing_dir = Path(os.getenv('TATTOO_TESTING_DIR', '/tmp/run'))
 logs_dir = Path.home() / 'logs'
 failure_collection_dir = logs_dir / 'failures'
 pkgdev_template = str(Path(__file__).parent / 'pkgdev.tatt.template.sh')
-
-
-class IrkerSender(asyncio.DatagramProtocol):
-    IRC_CHANNEL = "#gentoo-tattoo"
-
-    def __init__(self, identifier: str, bugno: int, msg: str):
-        irker_spigot = f"ircs://irc.libera.chat:6697/{IrkerSender.IRC_CHANNEL}"
-        message = f"\x0314[{identifier}]: \x0307bug #{bugno}\x0F - {msg}"
-        self.message = json.dumps({"to": irker_spigot, "privmsg": message}).encode("utf8")
-
-    def connection_made(self, transport):
-        transport.sendto(self.message)
-        transport.close()
-
-    def error_received(self, exc):
-        logging.error("send to irker failed", exc_info=exc)
-
-    @staticmethod
-    async def send_message(identifier: str, bugno: int, msg: str):
-        await asyncio.get_event_loop().create_datagram_endpoint(
-            lambda: IrkerSender(identifier, bugno, msg),
-            remote_addr=("127.0.0.1", 6659)
-        )
+bugzilla_grants: deque[asyncio.Future] = deque()
+extra_env_files: list[str] = []
+package_stats = PackageStats(logs_dir / 'package-stats.json')
+log_store = LogStore(logs_dir, budget=parse_size(os.getenv('TATTOO_LOGS_BUDGET', '20G')))
+tmpdir_placement = TmpdirPlacement(
+    tmpfs_dir=Path(os.getenv('TATTOO_TMPFS_TMPDIR', '/tmp')),
+    disk_dir=Path(os.getenv('TATTOO_DISK_TMPDIR', '/var/tmp')),
+    budget=parse_size(budget) if (budget := os.getenv('TATTOO_TMPFS_BUDGET')) else None,
+)
+
+BUGZILLA_RATE_LIMITED = 'tatt failed with bugzilla rate'
+RATE_LIMIT_MARKER = b'request due to maintenance downtime or capacity'
+
+TATT_DURATION = metrics.Histogram('tattoo_tatt_seconds', 'Time spent in `pkgdev tatt` generating the test script')
+BUILD_DURATION = metrics.Histogram('tattoo_build_seconds', 'Time spent running the test script')
+CLEANUP_DURATION = metrics.Histogram('tattoo_cleanup_seconds', 'Time spent cleaning up after the test script')
+JOBS_DONE = metrics.Counter('tattoo_jobs_total', 'Finished testing jobs by result')
+JOB_SLOTS = metrics.Gauge('tattoo_job_slots', 'Amount of testing job slots')
+JOB_SLOTS_BUSY = metrics.Gauge('tattoo_job_slots_busy', 'Amount of testing job slots running a job')
 
 
 def parse_report_file(report_file: Path) -> Iterator[dict[str, str]]:
@@ -84,17 +89,67 @@ def collect_failure_text(report_file: Path) -> str:
     for run in report:
         if run.get('result', '').lower() != 'true':
             atom = run['atom']
+            log = f" ({Path(log_file).name})" if (log_file := run.get('log_file')) else ''
             if failure_str := run.get('failure_str', None):
-                failures.append(f'   {atom} special fail: {failure_str}')
+                failures.append(f'   {atom} special fail: {failure_str}{log}')
             elif 'test' in run['features']:
-                failures.append(f'   {atom} test run failed')
+                failures.append(f'   {atom} test run failed{log}')
             elif useflags := run['useflags']:
-                failures.append(f'   {atom} USE flag run failed: [{useflags}]')
+                failures.append(f'   {atom} USE flag run failed: [{useflags}]{log}')
             else:
-                failures.append(f'   {atom} default USE failed')
+                failures.append(f'   {atom} default USE failed{log}')
     return f"fail ({len(failures)} fails / {len(report)} runs):\n" + "\n".join(failures)
 
 
+def record_durations(report_file: Path):
+    """Record into package stats how long every package took to test, from the report file."""
+    runs = [run for run in parse_report_file(report_file) if 'time' in run and 'atom' in run]
+    durations: dict[str, float] = {}
+    for run, next_run in zip(runs, runs[1:] + [None]):
+        with contextlib.suppress(ValueError):
+            started = datetime.fromisoformat(run['time']).replace(tzinfo=UTC)
+            finished = datetime.fromisoformat(next_run['time']).replace(tzinfo=UTC) if next_run else datetime.now(tz=UTC)
+            package = atom_package(run['atom'])
+            durations[package] = durations.get(package, 0) + (finished - started).total_seconds()
+    for package, duration in durations.items():
+        package_stats.record(package, 'duration', duration)
+    if durations:
+        package_stats.save()
+
+
+def record_build_sizes(peaks: dict[str, int]):
+    """Record into package stats the peak build directory size of every package."""
+    for package, size in peaks.items():
+        if size:
+            # grow at once, but shrink slowly, as running out of tmpfs fails the build
+            previous = package_stats.get(package, 'build_size') or 0
+            package_stats.record(package, 'build_size', size, weight=1.0 if size > previous else 0.5)
+    if any(peaks.values()):
+        package_stats.save()
+
+
+async def stream_output(proc: asyncio.subprocess.Process, dst: BinaryIO | None) -> bool:
+    """Copy the process output into ``dst`` until it exits.
+
+    The output is drained even without ``dst``, or after writing into it
+    failed, so the process never blocks on a full pipe. Returns whether
+    bugzilla's rate limit error was in the output.
+    """
+    rate_limited = False
+    tail = b''
+    while chunk := await proc.stdout.read(1 << 16):
+        if dst is not None:
+            try:
+                dst.write(chunk)
+            except OSError as exc:
+                logging.error('writing `pkgdev tatt` log failed, discarding the rest', exc_info=exc)
+                dst = None
+        rate_limited = rate_limited or RATE_LIMIT_MARKER in tail + chunk
+        tail = chunk[-len(RATE_LIMIT_MARKER):]
+    await proc.wait()
+    return rate_limited
+
+
 def preexec():
     signal.signal(signal.SIGCHLD, signal.SIG_DFL)
     os.setpgrp()
@@ -132,7 +187,23 @@ async def monitor_hang_job(pid: int, bug_no: int):
         return True
 
 
-async def test_run(writer: Callable[[Any], Any], bug_no: int) -> str:
+async def bugzilla_token(writer: Callable[[Any], Any], count: int = 1):
+    """Wait for the manager to grant budget for ``count`` bugzilla requests.
+
+    The manager shares one budget between all its testers. If it doesn't answer
+    (for example an older manager), continue after a timeout.
+    """
+    grant = asyncio.get_running_loop().create_future()
+    bugzilla_grants.append(grant)
+    await writer(messages.BugzillaTokenRequest(count=count))
+    try:
+        await asyncio.wait_for(asyncio.shield(grant), timeout=300)
+    except asyncio.TimeoutError:
+        logging.warning('no bugzilla budget granted by manager, continuing')
+
+
+async def test_run(writer: Callable[[Any], Any], bug_no: int, admission: AdmissionController) -> str:
+    await bugzilla_token(writer)
     logging.info('testing %d - pkgdev tatt', bug_no)
     args = (
         f'--bug={bug_no}',
@@ -146,6 +217,7 @@ async def test_run(writer: Callable[[Any], Any], bug_no: int) -> str:
         args += (f'--api-key={key}', )
     if (conf := Path(__file__).parent / 'pkgdev.tattoo.conf').exists():
         args += (f'--config={str(conf)}', )
+    args += tuple(f'--extra-env-file={env_file}' for env_file in extra_env_files)
     proc = await asyncio.create_subprocess_exec(
         'pkgdev', 'tatt', *args,
         stdout=subprocess.PIPE,
@@ -153,62 +225,144 @@ async def test_run(writer: Callable[[Any], Any], bug_no: int) -> str:
         preexec_fn=preexec,
         cwd=testing_dir,
     )
+    tatt_log: BinaryIO | None = None
+    dst_failure: Path | None = None
+    rate_limited = False
+    try:
+        tatt_log, dst_failure = open_compressed(failure_collection_dir / f'{bug_no}.tatt-failure.log')
+    except OSError as exc:
+        logging.error('failed opening log file for `pkgdev tatt -b %d`', bug_no, exc_info=exc)
     try:
-        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=60)
+        with TATT_DURATION.time():
+            rate_limited = await asyncio.wait_for(stream_output(proc, tatt_log), timeout=60)
     except asyncio.TimeoutError:
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
         logging.error('`pkgdev tatt -b %d` timed out', bug_no)
         return 'tatt timed out'
+    finally:
+        if tatt_log is not None:
+            try:
+                tatt_log.close()
+            except OSError as exc:
+                logging.error('failed closing log file for `pkgdev tatt -b %d`', bug_no, exc_info=exc)
+        if dst_failure is not None:
+            if proc.returncode == 0 or rate_limited:
+                dst_failure.unlink(missing_ok=True)
+            else:
+                log_store.add(bug_no, [dst_failure])
     if proc.returncode != 0:
-        try:
-            if b'request due to maintenance downtime or capacity' in stdout:
-                logging.error('failed with `tatt -b %d` - bugzilla rate limit', bug_no)
-                return 'tatt failed with bugzilla rate'
-            (dst_failure := failure_collection_dir / f'{bug_no}.tatt-failure.log').write_bytes(stdout)
+        if rate_limited:
+            logging.error('failed with `tatt -b %d` - bugzilla rate limit', bug_no)
+            return BUGZILLA_RATE_LIMITED
+        if dst_failure is not None:
             logging.error('failed with `pkgdev tatt -b %d` - log saved at %s', bug_no, dst_failure)
-        except Exception as exc:
-            logging.error('failed with `pkgdev tatt -b %d`, but saving log to file failed', exc_info=exc)
+        else:
+            logging.error('failed with `pkgdev tatt -b %d`, but saving log to file failed', bug_no)
         return 'tatt failed'
 
+    atoms = script_atoms(testing_dir / f'{bug_no}.sh')
+    # the worker already holds one slot for this job
+    extra_cost = job_cost(package_stats.maximum(atoms, 'duration')) - 1
+    if extra_cost:
+        await admission.acquire(extra_cost, held=1)
+    placement = tmpdir_placement.place(package_stats.maximum(atoms, 'build_size'))
+    build_sizes: dict[str, int] = {}
+    sampler = asyncio.create_task(sample_build_size(placement.tmpdir, atoms, build_sizes))
     try:
-        logging.info('testing %d - test run', bug_no)
+        logging.info('testing %d - test run in %s', bug_no, placement.tmpdir)
+        env = None
+        if placement.env_file:
+            env = os.environ | {'TATTOO_TMPDIR_ENV': placement.env_file, 'TATTOO_PORTAGE_TMPDIR': str(placement.tmpdir)}
+        started = asyncio.get_running_loop().time()
         proc = await asyncio.create_subprocess_exec(
             testing_dir / f'{bug_no}.sh',
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
             preexec_fn=preexec,
             cwd=testing_dir,
+            env=env,
         )
         monitor = asyncio.create_task(monitor_hang_job(proc.pid, bug_no))
         exit_code = await proc.wait()
         monitor.cancel()
+        BUILD_DURATION.observe(asyncio.get_running_loop().time() - started, success=str(exit_code == 0).lower())
         if exit_code != 0:
             await writer(messages.BugJobDone(bug_number=bug_no, success=False))
             return collect_failure_text(testing_dir / f'{bug_no}.report')
         await writer(messages.BugJobDone(bug_number=bug_no, success=True))
         return ''
     finally:
+        await admission.release(extra_cost)
+        sampler.cancel()
+        tmpdir_placement.release(placement)
+        with contextlib.suppress(Exception):
+            record_durations(testing_dir / f'{bug_no}.report')
+            record_build_sizes(build_sizes)
+        try:
+            log_store.add(bug_no, (
+                run[key]
+                for run in parse_report_file(testing_dir / f'{bug_no}.report')
+                for key in ('log_file', 'extra_logs') if key in run
+            ))
+            await log_store.enforce_budget()
+        except Exception as exc:
+            logging.error('indexing logs of %d failed', bug_no, exc_info=exc)
         logging.info('testing %d - cleanup', bug_no)
-        proc = await asyncio.create_subprocess_exec(
-            testing_dir / f'{bug_no}.sh', '--clean',
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            preexec_fn=preexec,
-            cwd=testing_dir,
-        )
-        await proc.wait()
+        with CLEANUP_DURATION.time():
+            proc = await asyncio.create_subprocess_exec(
+                testing_dir / f'{bug_no}.sh', '--clean',
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                preexec_fn=preexec,
+                cwd=testing_dir,
+            )
+            await proc.wait()
+
+
+def job_result_label(result: str) -> str:
+    if not result:
+        return 'pass'
+    if result == BUGZILLA_RATE_LIMITED:
+        return 'rate_limited'
+    if result.startswith('tatt '):
+        return 'tatt_failed'
+    return 'fail'
+
+
+async def push_metrics(writer: Callable[[Any], Any]):
+    with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+        while True:
+            await writer(messages.MetricsReport(families=metrics.collect()))
+            await asyncio.sleep(int(os.getenv('TATTOO_METRICS_PUSH_SECS', '60')))
 
 
-async def worker_func(worker: messages.Worker, queue: BugsQueue, writer: Callable[[Any], Any]):
+async def worker_func(queue: BugsQueue, writer: Callable[[Any], Any], admission: AdmissionController, notifier: IrkerNotifier):
     with contextlib.suppress(asyncio.CancelledError):
         while True:
-            bug_no: int = await queue.get()
+            # take a bug only once admitted, so paused slots leave bugs in the queue
+            await admission.acquire()
             try:
-                result = await test_run(writer, bug_no)
-                await IrkerSender.send_message(worker.name, bug_no, result or 'success')
+                bug_no: int = await queue.get()
+            except asyncio.CancelledError:
+                await admission.release()
+                return
+            JOB_SLOTS_BUSY.inc()
+            try:
+                result = await test_run(writer, bug_no, admission)
+                JOBS_DONE.inc(result=job_result_label(result))
+                if result == BUGZILLA_RATE_LIMITED and (delay := queue.retry_later(bug_no)) is not None:
+                    logging.info('requeuing %d in %.0fs because of bugzilla rate limit', bug_no, delay)
+                else:
+                    notifier.add(bug_no, result or 'success')
             except asyncio.CancelledError:
                 return
             except Exception as exc:
                 logging.error('fail', exc_info=exc)
+                JOBS_DONE.inc(result='error')
+            finally:
+                JOB_SLOTS_BUSY.inc(-1)
+                await admission.release()
             queue.bug_done(bug_no)
 
 
@@ -237,16 +391,25 @@ async def running_emerge_jobs() -> tuple[str, ...]:
     )
 
 
-def queue_append_bugs(queue: BugsQueue, worker: messages.Worker, job: messages.GlobalJob):
-    for _, bugs in bugs_fetcher.collect_bugs(job.bugs, worker):
-        bugs = list(frozenset(bugs).difference(queue.bugs, queue.running))
-        shuffle(bugs)
-        for bug_no in bugs:
-            logging.info('Queuing %d', bug_no)
-            queue.put_nowait(BugsQueueItem(bug=bug_no, priority=job.priority))
+async def queue_append_bugs(queue: BugsQueue, worker: messages.Worker, job: messages.GlobalJob, writer: Callable[[Any], Any]):
+    try:
+        await bugzilla_token(writer, count=2)
+        for _, bugs in bugs_fetcher.collect_bugs(job.bugs, worker, done_blockers=job.released_blockers):
+            bugs = list(frozenset(bugs).difference(queue.bugs, queue.running, queue.delayed))
+            shuffle(bugs)
+            for bug_no in bugs:
+                logging.info('Queuing %d', bug_no)
+                queue.put_nowait(BugsQueueItem(bug=bug_no, priority=job.priority))
+    except Exception as exc:
+        logging.error('Running GlobalJob failed', exc_info=exc)
+
+
+async def send_profile(writer: Callable[[Any], Any], request: messages.ProfileRequest):
+    with contextlib.suppress(ConnectionError):
+        await writer(messages.ProfileResult(text=await profiler.profile(request.seconds, request.mode)))
 
 
-async def handler(worker: messages.Worker, jobs_count: int):
+async def handler(worker: messages.Worker, jobs_count: int, min_jobs: int, ccache: Ccache | None):
     reader, writer = await asyncio.open_unix_connection(path=messages.SOCKET_FILENAME)
     def writer_func(obj: Any):
         writer.write(messages.dump(obj))
@@ -255,7 +418,17 @@ async def handler(worker: messages.Worker, jobs_count: int):
     await writer_func(worker)
 
     queue = BugsQueue()
-    tasks = [asyncio.create_task(worker_func(worker, queue, writer_func), name=f'Tester {i + 1}') for i in range(jobs_count)]
+    admission = AdmissionController(min_jobs=min(min_jobs, jobs_count), max_jobs=jobs_count)
+    JOB_SLOTS.set(jobs_count)
+    notifier = IrkerNotifier(worker.name, logs_dir / 'irker-spool.jsonl')
+    tasks = [asyncio.create_task(worker_func(queue, writer_func, admission, notifier), name=f'Tester {i + 1}') for i in range(jobs_count)]
+    tasks.append(asyncio.create_task(admission.run()))
+    tasks.append(asyncio.create_task(notifier.run()))
+    tasks.append(asyncio.create_task(push_metrics(writer_func)))
+    tasks.append(asyncio.create_task(metrics.monitor_event_loop_lag()))
+    tasks.append(asyncio.create_task(profiler.monitor_blocking()))
+    if ccache:
+        tasks.append(asyncio.create_task(ccache.run()))
 
     sdnotify('READY=1')
 
@@ -263,14 +436,20 @@ async def handler(worker: messages.Worker, jobs_count: int):
         while data := await reader.readuntil(b'\n'):
             data = messages.load(data)
             if isinstance(data, messages.GlobalJob):
-                try:
-                    queue_append_bugs(queue, worker, data)
-                except Exception as exc:
-                    logging.error('Running GlobalJob failed', exc_info=exc)
+                asyncio.ensure_future(queue_append_bugs(queue, worker, data, writer_func))
+            elif isinstance(data, messages.BugzillaTokenGrant):
+                if bugzilla_grants:
+                    bugzilla_grants.popleft().set_result(None)
+            elif isinstance(data, messages.ProfileRequest):
+                tasks.append(asyncio.create_task(send_profile(writer_func, data)))
             elif isinstance(data, messages.GetStatus):
                 await writer_func(messages.TesterStatus(
-                    bugs_queue=tuple(queue.running) + queue.bugs,
+                    bugs_queue=tuple(queue.running) + queue.bugs + tuple(queue.delayed),
                     merging_atoms=await running_emerge_jobs(),
+                    jobs=jobs_count,
+                    slots_allowed=admission.allowed,
+                    admission=admission.reason,
+                    ccache=ccache and await ccache.update_stats(),
                 ))
     except asyncio.IncompleteReadError:
         logging.warning('Abrupt connection closed')
@@ -284,6 +463,9 @@ async def handler(worker: messages.Worker, jobs_count: int):
             await writer.wait_closed()
         for task in tasks:
             task.cancel()
+        for grant in bugzilla_grants:
+            grant.cancel()
+        bugzilla_grants.clear()
         logging.info('closing')
 
 
@@ -294,7 +476,11 @@ def main():
     parser.add_argument("-a", "--arch", action="store", default=os.getenv('ARCH'),
                         help="Gentoo's arch name. Prepend with ~ for keywording")
     parser.add_argument("-j", "--jobs", type=int, action="store", default=1,
-                        help="Amount of simultaneous testing jobs")
+                        help="Maximal amount of simultaneous testing jobs")
+    parser.add_argument("--min-jobs", type=int, action="store", default=1,
+                        help="Minimal amount of simultaneous testing jobs, when the host is under pressure")
+    parser.add_argument("--ccache", action="store_true",
+                        help="Build with a compiler cache shared by all jobs of this arch and profile")
     options = parser.parse_args()
 
     if not options.arch:
@@ -311,12 +497,24 @@ def main():
 
     worker = messages.Worker(name=options.name, arch=options.arch)
 
+    ccache = None
+    if options.ccache:
+        if not Ccache.available():
+            parser.error("--ccache requires dev-util/ccache")
+        ccache = Ccache(options.arch)
+        extra_env_files.append(ccache.setup())
+        logging.info('Using ccache at %s', ccache.cache_dir)
+
+    if tmpdir_placement.budget:
+        tmpdir_placement.setup()
+        logging.info('Using tmpfs at %s for builds up to %d MiB', tmpdir_placement.tmpfs_dir, tmpdir_placement.budget >> 20)
+
     asyncio.set_event_loop(loop := asyncio.new_event_loop())
     retry_counter = 0
     while retry_counter < 5:
         try:
             logging.info('connecting to manager')
-            loop.run_until_complete(handler(worker, options.jobs))
+            loop.run_until_complete(handler(worker, options.jobs, options.min_jobs, ccache))
             retry_counter = 0
         except KeyboardInterrupt:
             logging.info('Caught a CTRL + C, good bye')
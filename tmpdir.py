@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+import os
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+from package_stats import atom_package
+
+ENV_DIR = Path('/etc/portage/env')
+
+
+class Placement(NamedTuple):
+    tmpdir: Path
+    reserved: int
+    env_file: str | None
+
+
+def directory_size(path: Path) -> int:
+    """Disk (or RAM) usage of a directory tree, in bytes."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            with contextlib.suppress(OSError):
+                size += os.lstat(os.path.join(root, name)).st_blocks * 512
+    return size
+
+
+def build_dirs_size(tmpdir: Path, atoms: Iterable[str]) -> dict[str, int]:
+    """Current size of the build directories of every package, inside ``PORTAGE_TMPDIR``."""
+    sizes = {}
+    for package in map(atom_package, atoms):
+        category, _, name = package.partition('/')
+        sizes[package] = sum(directory_size(path) for path in (tmpdir / 'portage' / category).glob(f'{name}-[0-9]*'))
+    return sizes
+
+
+async def sample_build_size(tmpdir: Path, atoms: tuple[str, ...], peaks: dict[str, int], interval: float = 15):
+    """Record into ``peaks`` the peak build directory size of every package, until cancelled."""
+    while True:
+        for package, size in (await asyncio.to_thread(build_dirs_size, tmpdir, atoms)).items():
+            peaks[package] = max(peaks.get(package, 0), size)
+        await asyncio.sleep(interval)
+
+
+class TmpdirPlacement:
+    """Choose ``PORTAGE_TMPDIR`` per job, between tmpfs and disk.
+
+    A job builds on tmpfs when the peak build directory size of its packages,
+    seen on previous runs, fits into what is left of the tmpfs budget shared
+    by all running jobs. Packages never seen before build on disk.
+    """
+
+    SAFETY_FACTOR = 1.5
+
+    def __init__(self, tmpfs_dir: Path, disk_dir: Path, budget: int | None):
+        self.tmpfs_dir = tmpfs_dir
+        self.disk_dir = disk_dir
+        self.budget = budget
+        self.reserved = 0
+
+    def env_file(self, kind: str) -> str:
+        return f'tattoo-tmpdir-{kind}.conf'
+
+    def setup(self):
+        """Write the env files which set ``PORTAGE_TMPDIR``, used by the per job ``package.env``."""
+        ENV_DIR.mkdir(parents=True, exist_ok=True)
+        for kind, tmpdir in (('tmpfs', self.tmpfs_dir), ('disk', self.disk_dir)):
+            (ENV_DIR / self.env_file(kind)).write_text(f'PORTAGE_TMPDIR="{tmpdir}"\n')
+
+    def place(self, expected_size: float | None) -> Placement:
+        if not self.budget:
+            return Placement(self.disk_dir, 0, None)
+        if expected_size is not None and self.reserved + (size := int(expected_size * self.SAFETY_FACTOR)) <= self.budget:
+            self.reserved += size
+            return Placement(self.tmpfs_dir, size, self.env_file('tmpfs'))
+        return Placement(self.disk_dir, 0, self.env_file('disk'))
+
+    def release(self, placement: Placement):
+        self.reserved -= placement.reserved
@@ -0,0 +1,75 @@
+import asyncio
+import hmac
+import logging
+import os
+import ssl
+from pathlib import Path
+
+TLS_CERT = os.getenv('TATTOO_TLS_CERT')
+TLS_KEY = os.getenv('TATTOO_TLS_KEY')
+TLS_CA = os.getenv('TATTOO_TLS_CA')
+TOKEN_FILE = os.getenv('TATTOO_TOKEN_FILE')
+
+AUTH_PREFIX = b'AUTH '
+
+
+def read_token() -> bytes | None:
+    return Path(TOKEN_FILE).read_bytes().strip() if TOKEN_FILE else None
+
+
+def split_address(address: str) -> tuple[str | None, int]:
+    host, port = address.rsplit(':', maxsplit=1)
+    return host.strip('[]') or None, int(port)
+
+
+def server_context() -> ssl.SSLContext:
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(TLS_CERT, TLS_KEY)
+    if TLS_CA:
+        context.load_verify_locations(TLS_CA)
+        context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
+
+def client_context() -> ssl.SSLContext:
+    context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=TLS_CA)
+    if TLS_CERT:
+        context.load_cert_chain(TLS_CERT, TLS_KEY)
+    return context
+
+
+async def tcp_server(handler, listen: str) -> asyncio.Server:
+    """Serve ``handler`` over TLS on ``host:port``.
+
+    Clients are authenticated by a certificate signed by ``TATTOO_TLS_CA``,
+    and/or by the token in ``TATTOO_TOKEN_FILE``, which they must send as
+    the first line. Nothing is unpickled before a client is authenticated.
+    """
+    if not TLS_CERT or not TLS_KEY:
+        raise ValueError('TCP listener requires TATTOO_TLS_CERT and TATTOO_TLS_KEY')
+    token = read_token()
+    if not TLS_CA and token is None:
+        raise ValueError('TCP listener requires client certificates (TATTOO_TLS_CA) or a token (TATTOO_TOKEN_FILE)')
+
+    async def authenticated(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if token is not None:
+            try:
+                line = await asyncio.wait_for(reader.readuntil(b'\n'), timeout=10)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+                line = b''
+            if not hmac.compare_digest(line.rstrip(b'\n'), AUTH_PREFIX + token):
+                logging.warning('rejected connection from %s: bad token', writer.get_extra_info('peername'))
+                writer.close()
+                return
+        await handler(reader, writer)
+
+    host, port = split_address(listen)
+    return await asyncio.start_server(authenticated, host=host, port=port, ssl=server_context())
+
+
+async def open_tcp_connection(address: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    host, port = split_address(address)
+    reader, writer = await asyncio.open_connection(host, port, ssl=client_context())
+    if (token := read_token()) is not None:
+        writer.write(AUTH_PREFIX + token + b'\n')
+    return reader, writer